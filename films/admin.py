@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import (Person, Movie, Cast, Crew, Job, Review, UserMovieLink, MediaLink, DailyMovie)
+from .models import (Person, Movie, Cast, Crew, Job, Review, UserMovieLink, MediaLink, DailyMovie, PosterVariant,
+                     ImportCheckpoint, DailyPickSchedule, SiteCounter)
 
 admin.site.register(Person)
 admin.site.register(Movie)
@@ -11,3 +12,7 @@ admin.site.register(Review)
 admin.site.register(UserMovieLink)
 admin.site.register(MediaLink)
 admin.site.register(DailyMovie)
+admin.site.register(PosterVariant)
+admin.site.register(ImportCheckpoint)
+admin.site.register(DailyPickSchedule)
+admin.site.register(SiteCounter)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FilmsConfig(AppConfig):
     name = 'films'
+
+    def ready(self):
+        from . import signals  # noqa: F401 -- connects the receivers
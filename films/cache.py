@@ -0,0 +1,175 @@
+"""Two-tier cache for the catalog pages: a small LRU in each worker process in front of the shared Django cache.
+
+Page data is cached under keys that carry the version numbers of everything it was built from, e.g. a movie
+page's credits under 'films:page:movie_detail:12:<version of movie 12>'. Nothing is ever deleted: signals.py
+bumps the version of a Movie or Person whenever it, or a Cast, Crew, MediaLink or Review row attached to it,
+changes, and from then on every process asks for a key nobody has built yet. Because a key can only ever hold one
+value, the per-process LRU can keep values without hearing about invalidations; only the version numbers
+themselves are always read from the shared cache (one get_many per lookup).
+
+Version numbers start from the clock rather than 1, so a version that was evicted from the shared cache can't
+come back as a number some stale value is still stored under. bump() only uses cache.incr() on backends that
+increment in place (memcached, locmem); the generic incr() the file and db caches inherit re-sets the key with
+the default timeout, which would let a version expire. Bulk writes (load_catalog, poster imports) don't
+send signals, so they call invalidate_all(), which moves a version every key includes.
+
+movie.html caches its shared parts as template fragments with the same versions (fragment_version()): credits,
+links and the poster under the movie's version, and the reviews under a separate per-movie reviews version that
+only Review writes move, so a new review doesn't throw away the credits.
+
+stats counts local hits, shared hits and misses for this process; cache_stats_view shows them to staff.
+"""
+
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache
+from django.db import transaction
+
+MOVIE = 'movie'
+PERSON = 'person'
+MOVIE_REVIEWS = 'movie_reviews'
+EVERYTHING = ('all', 0)         # part of every key, for after bulk writes
+CATALOG = ('catalog', 0)        # anything on the list pages: movies added, removed, renamed, free links
+RANKING = ('ranking', 0)        # the order of the top movies
+INDEX_PAGE = ('index', 0)       # the home page as a whole (whole-page cache, see middleware.py)
+FREE_LIST = ('free_list', 0)    # the free movies page
+
+PAGE_TIMEOUT = 24 * 60 * 60     # old versions age out of the shared cache on their own
+
+stats = Counter()
+
+
+class LocalCache():
+    """A thread-safe LRU dict of at most `size` entries"""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        """(True, value) on a hit, (False, None) on a miss; values may legitimately be None"""
+        with self.lock:
+            if key not in self.data:
+                return False, None
+            self.data.move_to_end(key)
+            return True, self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+local = LocalCache(getattr(settings, 'LOCAL_CACHE_SIZE', 500))
+
+
+def version_key(kind, pk):
+    return 'films:version:{}:{}'.format(kind, pk)
+
+
+def fresh_version():
+    return int(time.time() * 1000)
+
+
+def get_versions(depends):
+    """Current version numbers for a list of (kind, pk), in the same order"""
+    keys = [version_key(kind, pk) for kind, pk in depends]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, fresh_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(kind, pk):
+    """Move a version on; returns the new version"""
+    key = version_key(kind, pk)
+    stats['version_bumps'] += 1
+    if type(caches['default']).incr is not BaseCache.incr:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            pass    # never looked up (or evicted); a fresh version is newer than anything cached before
+    # a get and a set, so at least never back to a number used before, and never expiring
+    version = max((cache.get(key) or 0) + 1, fresh_version())
+    cache.set(key, version, None)
+    return version
+
+
+def bump_on_commit(kind, pk):
+    """Bump now, and again once the transaction commits
+
+    The first bump keeps this process from reading its own stale page; the second catches a page another request
+    built from the old rows while the transaction was still open. Outside a transaction on_commit runs at once.
+    """
+    bump(kind, pk)
+    transaction.on_commit(lambda: bump(kind, pk))
+
+
+def invalidate_all():
+    bump_on_commit(*EVERYTHING)
+
+
+def purge(*depends):
+    for kind, pk in depends:
+        bump_on_commit(kind, pk)
+
+
+def fragment_version(*depends):
+    """One string naming the current version of everything a cached piece depends on"""
+    return '.'.join(str(version) for version in get_versions([EVERYTHING] + list(depends)))
+
+
+def cached(name, depends, build, timeout=PAGE_TIMEOUT):
+    """build() once per version of everything it depends on, kept in the local LRU and the shared cache"""
+    key = 'films:page:{}:{}'.format(name, fragment_version(*depends))
+
+    found, value = local.get(key)
+    if found:
+        stats['local_hits'] += 1
+        return value
+
+    missing = object()
+    value = cache.get(key, missing)
+    if value is not missing:
+        stats['shared_hits'] += 1
+    else:
+        stats['misses'] += 1
+        value = build()
+        cache.set(key, value, timeout)
+
+    local.set(key, value)
+    return value
+
+
+def cache_stats():
+    lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+    return {
+        'pid': os.getpid(),
+        'local_hits': stats['local_hits'],
+        'shared_hits': stats['shared_hits'],
+        'misses': stats['misses'],
+        'hit_ratio': round((lookups - stats['misses']) / lookups, 3) if lookups else None,
+        'version_bumps': stats['version_bumps'],
+        'page_hits': stats['page_hits'],
+        'page_misses': stats['page_misses'],
+        'local_entries': len(local),
+        'local_size': local.size,
+        'backend': settings.CACHES['default']['BACKEND'],
+    }
@@ -0,0 +1,89 @@
+"""Cached, precomputed views of the catalog that several pages read.
+
+The A-Z index on the All Movies page is built from one ordered (id, slug, display_name) query and cached (see
+cache.py) against the catalog version, which moves whenever a Movie is saved or deleted (see signals.py).
+bulk_create() and friends don't send those signals, so the bulk loaders call invalidate_movie_index() themselves.
+
+Free streaming: Movie.has_free_link and the 'free_movies' SiteCounter are updated whenever a MediaLink is saved
+or deleted, so the free list is an indexed filter and its count a single-row read. repair_free_links() rebuilds
+both from the MediaLink table, for after bulk loads or if they ever drift.
+"""
+
+import string
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import CATALOG, FREE_LIST, INDEX_PAGE, bump_on_commit, cached, purge
+from .models import Movie, MediaLink, SiteCounter
+from .text import normalize_text
+
+OTHER = '#'     # heading for titles that don't start with a letter
+
+
+def index_letter(display_name):
+    """'The Killers' -> 'T', 'Élena' -> 'E', '99 River Street' -> '#'"""
+    first = normalize_text(display_name or '')[:1].upper()
+    return first if first in string.ascii_uppercase else OTHER
+
+
+def build_movie_index():
+    """[(heading, [(url, display_name)])] for '#' and every letter A-Z, empty letters included"""
+    sections = {heading: [] for heading in OTHER + string.ascii_uppercase}
+
+    movies = Movie.objects.order_by(Lower('display_name'), 'id').values_list('id', 'slug', 'display_name')
+    for movie_id, slug, display_name in movies:
+        url = reverse('films:movie', kwargs={'pk': movie_id, 'slug': slug})
+        sections[index_letter(display_name)].append((url, display_name))
+
+    return list(sections.items())
+
+
+def get_movie_index():
+    return cached('movie_index', [CATALOG], build_movie_index)
+
+
+def invalidate_movie_index():
+    bump_on_commit(*CATALOG)
+
+
+def refresh_free_flag(movie_id):
+    """Bring one movie's has_free_link (and the free movie count) in line with its media links"""
+    has_free = MediaLink.objects.filter(movie_id=movie_id, free=True).exists()
+
+    with transaction.atomic():
+        # only the request that actually flips the flag moves the counter, however many race to do it
+        flipped = Movie.objects.filter(id=movie_id).exclude(has_free_link=has_free).update(has_free_link=has_free)
+        if flipped:
+            change = 1 if has_free else -1
+            updated = SiteCounter.objects.filter(name=SiteCounter.FREE_MOVIES).update(value=F('value') + change)
+            if not updated:
+                repair_free_links()
+
+
+def repair_free_links():
+    """Recompute every has_free_link flag and the free movie count; returns (flags fixed, free movie count)"""
+    free_movie_ids = MediaLink.objects.filter(free=True).values('movie_id')
+
+    with transaction.atomic():
+        # updated_at too, since the free list's Last-Modified comes from it (see conditional.py)
+        now = timezone.now()
+        fixed = Movie.objects.filter(id__in=free_movie_ids, has_free_link=False).update(has_free_link=True, updated_at=now)
+        fixed += (Movie.objects.filter(has_free_link=True).exclude(id__in=free_movie_ids)
+                  .update(has_free_link=False, updated_at=now))
+
+        count = Movie.objects.filter(has_free_link=True).count()
+        SiteCounter.objects.update_or_create(name=SiteCounter.FREE_MOVIES, defaults={'value': count})
+        purge(FREE_LIST, INDEX_PAGE)
+
+    return fixed, count
+
+
+def free_movie_count():
+    count = SiteCounter.objects.filter(name=SiteCounter.FREE_MOVIES).values_list('value', flat=True).first()
+    if count is None:
+        fixed, count = repair_free_links()
+    return count
@@ -0,0 +1,92 @@
+"""ETag / Last-Modified for the catalog pages, so repeat visits can be answered with a 304.
+
+Movie.updated_at and Person.updated_at move whenever anything shown on their page changes: the row itself
+(auto_now), and through touch() in signals.py whenever a Cast, Crew, MediaLink or Review row attached to it is
+saved or deleted, or a linked title or name changes. The bulk writers, which send no signals, touch the rows
+they changed themselves (touch_all() when that's everything).
+
+The validators come from one small indexed query run before the view (Django's condition() decorator), so a
+304 skips the DetailView/ListView machinery and all of the context queries. Only anonymous visitors get them:
+a logged in user's page also shows their own review and seen/favorite/watch state, which none of this tracks.
+"""
+
+from django.db.models import Count, Max
+from django.utils import timezone
+from django.views.decorators.http import condition
+
+from .cache import MOVIE, PERSON, bump_on_commit
+from .models import Movie, Person
+
+
+def touch(model, ids, bump=True):
+    """Mark these rows' pages as changed, without a save() (and so without the post_save signals)
+
+    Their page cache versions move too: a whole-page cache hit (middleware.py) answers If-None-Match from the
+    ETag stored with the page, so a new updated_at alone wouldn't reach anyone until the cached copy expired.
+    Pass bump=False when the caller has already called cache.invalidate_all().
+    """
+    ids = [pk for pk in ids if pk is not None]
+    if bump:
+        kind = MOVIE if model is Movie else PERSON
+        for pk in ids:
+            bump_on_commit(kind, pk)
+    now = timezone.now()
+    for start in range(0, len(ids), 500):     # a load can pass thousands, more than some dbs take in one IN
+        model.objects.filter(id__in=ids[start:start + 500]).update(updated_at=now)
+
+
+def touch_all():
+    now = timezone.now()
+    Movie.objects.update(updated_at=now)
+    Person.objects.update(updated_at=now)
+
+
+def validators(lookup):
+    """condition() arguments from lookup(request, **url_kwargs) -> (etag, last_modified), run once per request"""
+    def run(request, **kwargs):
+        if not hasattr(request, '_catalog_validators'):
+            if request.user.is_authenticated:
+                request._catalog_validators = (None, None)
+            else:
+                request._catalog_validators = lookup(request, **kwargs)
+        return request._catalog_validators
+
+    return condition(
+        etag_func=lambda request, *args, **kwargs: run(request, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: run(request, **kwargs)[1],
+    )
+
+
+def stamp(*parts):
+    return '-'.join(str(part) for part in parts)
+
+
+def detail_lookup(model):
+    def lookup(request, pk, slug=None, **kwargs):
+        updated_at = model.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            return None, None       # let the view 404
+        return stamp(model._meta.model_name, pk, updated_at.timestamp()), updated_at
+    return lookup
+
+
+def latest_change(queryset):
+    """(row count, newest updated_at) of a list; the count catches deletions, which leave updated_at where it was"""
+    latest = queryset.aggregate(updated_at=Max('updated_at'), count=Count('id'))
+    return latest['count'], latest['updated_at']
+
+
+def list_lookup(queryset):
+    def lookup(request, **kwargs):
+        count, updated_at = latest_change(queryset())
+        if updated_at is None:
+            return None, None
+        page = request.GET.get('page', '')
+        return stamp(count, updated_at.timestamp(), page), updated_at
+    return lookup
+
+
+movie_validators = validators(detail_lookup(Movie))
+person_validators = validators(detail_lookup(Person))
+movie_list_validators = validators(list_lookup(Movie.objects.all))
+free_list_validators = validators(list_lookup(lambda: Movie.objects.filter(has_free_link=True)))
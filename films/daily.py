@@ -0,0 +1,123 @@
+"""The home page's daily pick.
+
+Picks walk through DailyPickSchedule, a shuffled list of every movie id, one slot per day, so no movie comes up
+twice until the whole catalog has had its turn; then a fresh shuffle starts. advance() moves the pick on inside a
+transaction that locks the active DailyMovie row, so two requests at the rollover can't both create a new pick.
+The advance_daily_pick command does that from cron, and get_daily_pick() does it lazily if nobody ran the command.
+
+Everything the home page shows about the pick (movie, director, media links, related movies) is cached until
+the pick is due to change, so most requests cost one cache read.
+"""
+
+import random
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import INDEX_PAGE, purge
+from .models import Movie, Crew, DailyMovie, DailyPickSchedule
+
+DAILY_PICK_KEY = 'films:daily_pick'
+PICK_LIFETIME = timedelta(days=1)   # matches DailyMovie.check_update_status()
+
+
+def build_schedule(avoid_first=None):
+    """Shuffle every movie id into a new rotation; avoid_first keeps the last pick from opening the next one"""
+    movie_ids = list(Movie.objects.values_list('id', flat=True))
+    random.shuffle(movie_ids)
+    if len(movie_ids) > 1 and movie_ids[0] == avoid_first:
+        movie_ids[0], movie_ids[-1] = movie_ids[-1], movie_ids[0]
+
+    DailyPickSchedule.objects.all().delete()
+    DailyPickSchedule.objects.bulk_create(
+        DailyPickSchedule(position=position, movie_id=movie_id) for position, movie_id in enumerate(movie_ids)
+    )
+    return len(movie_ids)
+
+
+def next_movie_id(current_movie_id=None):
+    """The slot after the current pick, starting a new rotation once this one runs out"""
+    slots = DailyPickSchedule.objects.order_by('position')
+    position = slots.filter(movie_id=current_movie_id).values_list('position', flat=True).first()
+    if position is not None:
+        slots = slots.filter(position__gt=position)
+
+    movie_id = slots.values_list('movie_id', flat=True).first()
+    if movie_id is None:
+        build_schedule(avoid_first=current_movie_id)
+        movie_id = DailyPickSchedule.objects.order_by('position').values_list('movie_id', flat=True).first()
+    return movie_id
+
+
+def advance(force=False):
+    """Make the next scheduled movie the daily pick if a day has passed (or force); returns the active DailyMovie"""
+    try:
+        with transaction.atomic():
+            current = DailyMovie.objects.select_for_update().filter(active_movie=True).first()
+            if current is not None and not force and not current.check_update_status():
+                return current      # not due yet, or another request got here first
+
+            movie_id = next_movie_id(current.movie_id if current else None)
+            if movie_id is None:
+                return current      # no movies at all
+
+            if current is not None:
+                current.active_movie = False
+                current.save(update_fields=['active_movie'])
+            daily_count = current.daily_count + 1 if current else 1
+            new_record = DailyMovie.objects.create(movie_id=movie_id, active_movie=True, daily_count=daily_count)
+    except IntegrityError:
+        # with no active row there was nothing to lock, and a concurrent request created the first pick
+        return DailyMovie.objects.get(active_movie=True)
+
+    invalidate_daily_pick()
+    return new_record
+
+
+def build_pick(record):
+    """Everything the home page shows about a daily pick, loaded in one go"""
+    movie = Movie.objects.prefetch_related('poster_variants').get(id=record.movie_id)
+
+    credit = Crew.objects.filter(movie=movie, job__job_title='Director').select_related('person').first()
+    director = credit.person if credit else None
+
+    return {
+        'record_id': record.id,
+        'expires': record.date_posted + PICK_LIFETIME,
+        'movie': movie,
+        'director': director,
+        'media_links': list(movie.medialink_set.all()),
+        'related_movies': list(movie.get_related_movies(director)) if director else [],
+    }
+
+
+def get_daily_pick():
+    """The cached pick, advancing and rebuilding it when it's due; None only if there are no movies"""
+    pick = cache.get(DAILY_PICK_KEY)
+    now = timezone.now()
+    if pick is not None and now < pick['expires']:
+        return pick
+
+    record = DailyMovie.objects.filter(active_movie=True).first()
+    if record is None or record.check_update_status():
+        record = advance()
+    if record is None:
+        return None
+
+    pick = build_pick(record)
+    timeout = max(60, int((pick['expires'] - now).total_seconds()))
+    cache.set(DAILY_PICK_KEY, pick, timeout)
+    return pick
+
+
+def invalidate_daily_pick():
+    cache.delete(DAILY_PICK_KEY)
+    purge(INDEX_PAGE)
+
+
+def invalidate_if_picked(movie_id):
+    """For writes that don't save the Movie itself (e.g. reviews, which update its rating with F()), but show on it"""
+    if DailyMovie.objects.filter(active_movie=True, movie_id=movie_id).exists():
+        invalidate_daily_pick()
@@ -0,0 +1,146 @@
+"""Append-only journal of catalog ingest failures.
+
+Each failure is one json line (run, movie, stage, entity, reason, ts), buffered in memory and appended to the
+journal file every `flush_every` records, so a dirty import costs O(failures) writes instead of re-serializing
+the whole fail log after every failure. A 'run' line with per-stage counters and timings is written on close().
+"""
+
+import json
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+JOURNAL_FILE = 'json_data/ingest_journal.jsonl'
+
+
+class IngestJournal():
+
+    def __init__(self, filename=JOURNAL_FILE, flush_every=100, run_id=None):
+        self.filename = filename        # None keeps everything in memory, see merge()
+        self.flush_every = flush_every
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started = datetime.now(timezone.utc)
+
+        self.buffer = []
+        self.fails = Counter()          # failures, per stage
+        self.processed = Counter()      # items handled, per stage
+        self.timings = defaultdict(float)   # seconds spent, per stage
+        self.closed = False
+
+    def record(self, movie, stage, reason, entity=''):
+        """Add one failure record to the buffer, writing the buffer out once it is full"""
+        self.buffer.append({
+            'type': 'fail',
+            'run': self.run_id,
+            'movie': movie,
+            'stage': stage,
+            'entity': entity,
+            'reason': reason,
+            'ts': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        })
+        self.fails[stage] += 1
+
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def count(self, stage, n=1):
+        self.processed[stage] += n
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block of work against a stage name"""
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def merge(self, entries):
+        """Take over failure records collected by another journal, e.g. one kept in memory by a loader process"""
+        for entry in entries:
+            self.buffer.append(dict(entry, run=self.run_id))
+            self.fails[entry['stage']] += 1
+
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer or self.filename is None:
+            return
+        with open(self.filename, 'a') as fob:
+            fob.write(''.join(json.dumps(entry) + '\n' for entry in self.buffer))
+        self.buffer = []
+
+    def summary(self):
+        stages = sorted(set(self.fails) | set(self.processed) | set(self.timings))
+        return {
+            'type': 'run',
+            'run': self.run_id,
+            'started': self.started.isoformat(timespec='seconds'),
+            'stages': {
+                name: {
+                    'fails': self.fails[name],
+                    'processed': self.processed[name],
+                    'seconds': round(self.timings[name], 3),
+                }
+                for name in stages
+            },
+        }
+
+    def close(self):
+        """Write any buffered failures plus the run summary line"""
+        if self.closed:
+            return
+        self.buffer.append(self.summary())
+        self.flush()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_journal(filename=JOURNAL_FILE, run=None, stage=None, movie=None, entry_type=None):
+    """Stream entries back out of a journal file, optionally filtered"""
+    with open(filename) as fob:
+        for line in fob:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if run and entry.get('run') != run:
+                continue
+            if entry_type and entry.get('type') != entry_type:
+                continue
+            if stage and entry.get('stage') != stage:
+                continue
+            if movie and movie.lower() not in (entry.get('movie') or '').lower():
+                continue
+            yield entry
+
+
+def last_run_id(filename=JOURNAL_FILE):
+    """Return the id of the most recent run recorded in the journal, or None"""
+    run_id = None
+    for entry in read_journal(filename):
+        run_id = entry.get('run', run_id)
+    return run_id
+
+
+def summarize_journal(entries):
+    """Tally failure entries per stage and per reason, and list the movies they hit"""
+    per_stage = Counter()
+    per_reason = Counter()
+    movies = Counter()
+
+    for entry in entries:
+        if entry.get('type') != 'fail':
+            continue
+        per_stage[entry['stage']] += 1
+        per_reason[(entry['stage'], entry['reason'])] += 1
+        movies[entry['movie']] += 1
+
+    return {'per_stage': per_stage, 'per_reason': per_reason, 'movies': movies}
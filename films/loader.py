@@ -0,0 +1,553 @@
+"""Bulk catalog loader, used by the load_catalog management command.
+
+This replaces the row-by-row shell workflow in my_functions.py: people and jobs are resolved through
+in-memory name -> id maps, and every table is written with batched bulk_create() calls inside transactions,
+so a full rebuild costs a handful of queries per batch instead of several per credit.
+
+The load_* and sync_* methods take any iterable of source dicts and only ever hold one batch of them, so
+feeding them sources.iter_records() keeps memory flat however large the source file is.
+
+A full load can also keep an ImportCheckpoint per source file: each batch is committed in the same transaction
+that advances the checkpoint, so after an interruption the next run skips straight past every committed batch.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from .models import Person, Movie, Cast, Job, Crew, MediaLink, Review, UserMovieLink, ImportCheckpoint
+from .journal import IngestJournal
+from .my_functions import FailTracker, process_crew, reformat_date
+from .text import fold_text
+
+JOB_TITLES = ['Director', 'Producer', 'Cinematographer', 'Writer', 'Composer']
+
+YEAR_PATTERN = re.compile(r'\d{4}$')
+
+
+def fingerprint(record):
+    """Stable content hash of one source record; key order in the json doesn't matter"""
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def batched(items, size):
+    """Yield successive lists of at most `size` items; `items` can be any iterable, e.g. iter_records()"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def file_hash(filename, chunk_size=1024 * 1024):
+    """sha256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fob:
+        for chunk in iter(lambda: fob.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_checkpoint(filename, restart=False):
+    """Fetch or start the checkpoint for a source file; it starts over if the file has changed, or with restart"""
+    source_hash = file_hash(filename)
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        source=os.path.abspath(filename), defaults={'source_hash': source_hash},
+    )
+    if not created and (restart or checkpoint.source_hash != source_hash):
+        checkpoint.source_hash = source_hash
+        checkpoint.offset = 0
+        checkpoint.chunks = 0
+        checkpoint.finished = False
+        checkpoint.save()
+    return checkpoint
+
+
+class NameMap():
+    """Maps names to primary keys, with a case- and accent-insensitive fallback.
+
+    MySQL's default collation compares names ignoring case and accents, which is how the old
+    Person.objects.get(name=...) calls found 'Lee van Cleef' under 'Lee Van Cleef'; the fallback keeps that
+    behavior for the in-memory lookups (and keeps a sync from inserting such a variant as a second person).
+    """
+
+    def __init__(self, pairs=()):
+        self.exact = {}
+        self.folded = {}
+        for name, pk in pairs:
+            self.add(name, pk)
+
+    def add(self, name, pk):
+        self.exact[name] = pk
+        self.folded.setdefault(fold_text(name), pk)
+
+    def get(self, name):
+        pk = self.exact.get(name)
+        if pk is None:
+            pk = self.folded.get(fold_text(name))
+        return pk
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __len__(self):
+        return len(self.exact)
+
+
+class CatalogLoader():
+    """Writes Person, Movie, Cast, Crew and MediaLink rows in batches"""
+
+    def __init__(self, batch_size=500, journal=None):
+        self.batch_size = batch_size
+        self.flog = FailTracker(journal=journal if journal is not None else IngestJournal())
+        self.journal = self.flog.journal
+        self.counts = Counter()    # rows inserted, per model name
+        self.updated = Counter()   # rows updated in place (sync only)
+        self.deleted = Counter()   # rows deleted (sync only)
+        self.skipped = Counter()   # source records that were already in the db / unchanged
+        self.resumed = Counter()   # source records skipped because a checkpoint says they were committed
+        self.kept = []             # movies missing from the source that were not pruned (sync only)
+        self.changed_ids = defaultdict(set)     # 'Movie' / 'Person' -> ids whose pages a bulk write changed
+        self.source_people = set()
+        self.elapsed = 0.0
+
+        self.job_map = {}
+        self.person_map = NameMap()
+
+    # --- lookups -----------------------------------------------------------------------------------------------
+
+    def load_jobs(self):
+        """Make sure the 5 job records exist, and map job_title -> id"""
+        existing = dict(Job.objects.values_list('job_title', 'id'))
+        missing = [Job(job_title=title) for title in JOB_TITLES if title not in existing]
+        if missing:
+            Job.objects.bulk_create(missing)
+            self.counts['Job'] += len(missing)
+            existing = dict(Job.objects.values_list('job_title', 'id'))
+
+        self.job_map = existing
+        return self.job_map
+
+    def load_person_map(self):
+        """One query for every person in the db, instead of one Person.objects.get() per credit"""
+        self.person_map = NameMap(Person.objects.values_list('name', 'id'))
+        return self.person_map
+
+    def resume(self, records, checkpoint, model_name):
+        """Skip the records an earlier run already committed"""
+        if checkpoint is None or not checkpoint.offset:
+            return records
+        self.resumed[model_name] += checkpoint.offset
+        return islice(records, checkpoint.offset, None)
+
+    # --- people --------------------------------------------------------------------------------------------------
+
+    def build_person(self, person_dict):
+        """Return an unsaved Person for one entry of fin_people_list.json"""
+        name = person_dict['name']
+        dob = reformat_date(person_dict['dob']) if person_dict['dob'] else None
+        dod = reformat_date(person_dict['dod']) if person_dict['dod'] else None
+
+        # bulk_create() skips Person.save(), so the slug has to be set here
+        return Person(name=name, dob=dob, dod=dod, slug=slugify(name, allow_unicode=True),
+                      source_hash=fingerprint(person_dict))
+
+    def load_people(self, people, checkpoint=None):
+        """Insert every person not already in the db, then refresh the name -> id map"""
+        started = time.perf_counter()
+        self.load_person_map()
+
+        with self.journal.stage('load_people'):
+            self._load_people(self.resume(people, checkpoint, 'Person'), checkpoint)
+            if checkpoint is not None:
+                checkpoint.finish()
+
+        # bulk_create() doesn't hand back primary keys on MySQL, so re-read them in a single query
+        self.load_person_map()
+        self.elapsed += time.perf_counter() - started
+
+    def _load_people(self, people, checkpoint=None):
+        queued = NameMap()      # person_map is only re-read at the end, so a repeated name is only inserted once
+        for batch in batched(people, self.batch_size):
+            self.journal.count('load_people', len(batch))
+            new_people = []
+            for person_dict in batch:
+                if person_dict['name'] in self.person_map or person_dict['name'] in queued:
+                    self.skipped['Person'] += 1
+                    continue
+                try:
+                    new_people.append(self.build_person(person_dict))
+                except ValueError:
+                    self.flog.add_fail(person_dict['name'], 'bad dob/dod format', stage='load_people')
+                    continue
+                queued.add(person_dict['name'], len(new_people))
+
+            with transaction.atomic():
+                Person.objects.bulk_create(new_people, batch_size=self.batch_size)
+                if checkpoint is not None:
+                    checkpoint.advance(len(batch))
+            self.counts['Person'] += len(new_people)
+
+    # --- movies --------------------------------------------------------------------------------------------------
+
+    def get_year(self, movie_dict):
+        match = YEAR_PATTERN.search(movie_dict['release date'])
+        if match is None:
+            self.flog.add_fail(movie_dict['title'], 'no year in release date', stage='get_year',
+                               entity=movie_dict['release date'])
+            return None
+        return int(match.group())
+
+    def get_based_on(self, movie_dict):
+        # the value of 'based on' is either the string 'n/a', or a list: [work title, author]
+        if movie_dict['based on'] == 'n/a':
+            return 'n/a'
+        try:
+            return '{} by {}'.format(movie_dict['based on'][0], movie_dict['based on'][1]).title()
+        except (IndexError, TypeError):
+            self.flog.add_fail(movie_dict['title'], '"Based On" list extraction failed', stage='add_movie')
+            return 'n/a'
+
+    def build_movie(self, movie_dict):
+        """Return an unsaved Movie for one entry of fin_movie_list.json"""
+        title = movie_dict['title']
+        display_name = title.split('(')[0].strip() if '(' in title else title
+
+        return Movie(
+            name=title,
+            display_name=display_name,
+            year=self.get_year(movie_dict),
+            release_date=movie_dict['release date'],
+            studio=movie_dict['studio'],
+            based_on=self.get_based_on(movie_dict),
+            slug=slugify(title, allow_unicode=True),    # again, Movie.save() isn't called by bulk_create()
+            source_hash=fingerprint(movie_dict),
+            # no MediaLink signals either; the command recounts the free movies at the end
+            has_free_link=any(media_dict['free'] for media_dict in movie_dict['media_links'] or []),
+        )
+
+    def build_credits(self, movie_dict, movie_id):
+        """Return unsaved Cast, Crew and MediaLink rows for one movie, logging any unresolved names"""
+        title = movie_dict['title']
+        cast_rows, crew_rows, link_rows = [], [], []
+
+        for person_name, role in movie_dict['cast']:
+            person_id = self.person_map.get(person_name)
+            if person_id is None:
+                self.flog.add_fail(title, 'Person linkage', stage='add_cast', entity='{}, {}'.format(person_name, role))
+                continue
+            cast_rows.append(Cast(person_id=person_id, movie_id=movie_id, role=role))
+
+        for crew_name, crew_type in process_crew(movie_dict):
+            job_id = self.job_map.get(crew_type)
+            if job_id is None:
+                self.flog.add_fail(title, 'Job linkage', stage='add_crew', entity='{}, {}'.format(crew_name, crew_type))
+                continue
+            person_id = self.person_map.get(crew_name)
+            if person_id is None:
+                self.flog.add_fail(title, 'Person linkage', stage='add_crew', entity='{}, {}'.format(crew_name, crew_type))
+                continue
+            crew_rows.append(Crew(person_id=person_id, movie_id=movie_id, job_id=job_id))
+
+        for media_dict in movie_dict['media_links'] or []:
+            link_rows.append(MediaLink(
+                movie_id=movie_id,
+                url_link=media_dict['url'],
+                host=media_dict['host'],
+                free=media_dict['free'],
+                active=media_dict['active'],
+            ))
+
+        return cast_rows, crew_rows, link_rows
+
+    def load_movie_batch(self, batch, checkpoint=None):
+        """Write one batch of movies and all of their credits in a single transaction"""
+        titles = [movie_dict['title'] for movie_dict in batch]
+        existing = set(Movie.objects.filter(name__in=titles).values_list('name', flat=True))
+
+        new_dicts = []
+        for movie_dict in batch:
+            if movie_dict['title'] in existing:
+                self.skipped['Movie'] += 1
+            else:
+                existing.add(movie_dict['title'])     # a title repeated within the batch is only inserted once
+                new_dicts.append(movie_dict)
+
+        with transaction.atomic():
+            if new_dicts:
+                self.insert_movies(new_dicts)
+            if checkpoint is not None:
+                checkpoint.advance(len(batch))
+
+    def insert_movies(self, new_dicts):
+        """Insert movies that aren't in the db yet, along with all of their credits"""
+        movies = [self.build_movie(movie_dict) for movie_dict in new_dicts]
+
+        with transaction.atomic():
+            Movie.objects.bulk_create(movies, batch_size=self.batch_size)
+            movie_ids = dict(Movie.objects.filter(name__in=[m.name for m in movies]).values_list('name', 'id'))
+
+            all_cast, all_crew, all_links = [], [], []
+            for movie_dict in new_dicts:
+                cast_rows, crew_rows, link_rows = self.build_credits(movie_dict, movie_ids[movie_dict['title']])
+                all_cast.extend(cast_rows)
+                all_crew.extend(crew_rows)
+                all_links.extend(link_rows)
+
+            Cast.objects.bulk_create(all_cast, batch_size=self.batch_size)
+            Crew.objects.bulk_create(all_crew, batch_size=self.batch_size)
+            MediaLink.objects.bulk_create(all_links, batch_size=self.batch_size)
+
+        # the new movies got their updated_at on insert, but their people have a new title in their filmography
+        self.changed_ids['Person'].update(row.person_id for row in all_cast + all_crew)
+
+        self.counts['Movie'] += len(movies)
+        self.counts['Cast'] += len(all_cast)
+        self.counts['Crew'] += len(all_crew)
+        self.counts['MediaLink'] += len(all_links)
+
+    def load_movies(self, movies, checkpoint=None):
+        started = time.perf_counter()
+        if not self.job_map:
+            self.load_jobs()
+        if not len(self.person_map):
+            self.load_person_map()
+
+        with self.journal.stage('load_movies'):
+            for batch in batched(self.resume(movies, checkpoint, 'Movie'), self.batch_size):
+                self.journal.count('load_movies', len(batch))
+                self.load_movie_batch(batch, checkpoint)
+            if checkpoint is not None:
+                checkpoint.finish()
+
+        self.elapsed += time.perf_counter() - started
+
+    # --- delta sync ----------------------------------------------------------------------------------------------
+    #
+    # Every Movie and Person row carries the fingerprint of the source record it came from. A sync compares those
+    # against the source and only touches what changed: new records are inserted, changed movies get their own
+    # fields updated and their Cast / Crew / MediaLink rows diffed, unchanged records cost nothing beyond the lookup.
+    # Movies are matched on title and people on name, so Review and UserMovieLink rows (which hang off the Movie
+    # ids) are never touched, and neither is Cast.starring_role on credits that are still in the source (even if the
+    # role itself was reworded).
+
+    def sync_people(self, people):
+        started = time.perf_counter()
+        self.load_person_map()
+
+        with self.journal.stage('sync_people'):
+            for batch in batched(people, self.batch_size):
+                self.journal.count('sync_people', len(batch))
+                self.sync_people_batch(batch)
+
+        self.load_person_map()
+        self.elapsed += time.perf_counter() - started
+
+    def sync_people_batch(self, batch):
+        """Insert new people and update changed ones, matching names the way the full load does (NameMap)"""
+        people = []
+        for person_dict in batch:
+            self.source_people.add(person_dict['name'])
+            try:
+                people.append(self.build_person(person_dict))
+            except ValueError:
+                self.flog.add_fail(person_dict['name'], 'bad dob/dod format', stage='sync_people')
+
+        existing_ids = [self.person_map.get(person.name) for person in people]
+        hashes = dict(Person.objects.filter(id__in=[pk for pk in existing_ids if pk is not None])
+                      .values_list('id', 'source_hash'))
+
+        new_people, changed = [], []
+        queued = NameMap()      # a name repeated within this batch is only inserted once
+        for person, pk in zip(people, existing_ids):
+            if pk is None and person.name not in queued:
+                queued.add(person.name, len(new_people))
+                new_people.append(person)
+            elif pk is not None and hashes.get(pk) != person.source_hash:
+                person.id = pk
+                changed.append(person)
+            else:
+                self.skipped['Person'] += 1
+
+        with transaction.atomic():
+            Person.objects.bulk_create(new_people, batch_size=self.batch_size)
+            Person.objects.bulk_update(changed, ['dob', 'dod', 'source_hash'], batch_size=self.batch_size)
+
+        # later batches have to see these too; bulk_create() doesn't hand back ids on MySQL
+        inserted = Person.objects.filter(name__in=[person.name for person in new_people]).values_list('name', 'id')
+        for name, pk in inserted:
+            self.person_map.add(name, pk)
+
+        self.counts['Person'] += len(new_people)
+        self.updated['Person'] += len(changed)
+        self.changed_ids['Person'].update(person.id for person in changed)
+
+    def prune_people(self):
+        """Delete people that are no longer in the source and have no credits left"""
+        source_people = NameMap((name, True) for name in self.source_people)
+        missing = [pk for pk, name in Person.objects.values_list('id', 'name') if name not in source_people]
+        stale = Person.objects.filter(id__in=missing, cast__isnull=True, crew__isnull=True)
+        deleted, _ = stale.delete()
+        self.deleted['Person'] += deleted
+
+    def sync_movies(self, movies, prune=False):
+        started = time.perf_counter()
+        if not self.job_map:
+            self.load_jobs()
+        if not len(self.person_map):
+            self.load_person_map()
+
+        source_titles = set()
+        with self.journal.stage('sync_movies'):
+            for batch in batched(movies, self.batch_size):
+                self.journal.count('sync_movies', len(batch))
+                source_titles.update(movie_dict['title'] for movie_dict in batch)
+                self.sync_movie_batch(batch)
+
+            self.remove_missing_movies(source_titles, prune)
+
+        self.elapsed += time.perf_counter() - started
+
+    def sync_movie_batch(self, batch):
+        titles = [movie_dict['title'] for movie_dict in batch]
+        existing = {name: (pk, source_hash) for pk, name, source_hash in
+                    Movie.objects.filter(name__in=titles).values_list('id', 'name', 'source_hash')}
+
+        new_dicts, changed = [], []
+        for movie_dict in batch:
+            title = movie_dict['title']
+            if title not in existing:
+                new_dicts.append(movie_dict)
+            elif existing[title][1] != fingerprint(movie_dict):
+                changed.append((movie_dict, existing[title][0]))
+            else:
+                self.skipped['Movie'] += 1
+
+        if not new_dicts and not changed:
+            return
+
+        with transaction.atomic():
+            if new_dicts:
+                self.insert_movies(new_dicts)
+            if changed:
+                self.update_movies(changed)
+
+    def update_movies(self, changed):
+        """Update the movie rows themselves, then diff their credits against the source"""
+        movies = []
+        for movie_dict, movie_id in changed:
+            movie = self.build_movie(movie_dict)
+            movie.id = movie_id
+            movies.append(movie)
+
+        Movie.objects.bulk_update(
+            movies, ['display_name', 'year', 'release_date', 'studio', 'based_on', 'source_hash', 'has_free_link'],
+            batch_size=self.batch_size,
+        )
+        self.updated['Movie'] += len(movies)
+
+        wanted_cast, wanted_crew, wanted_links = [], [], []
+        for movie_dict, movie_id in changed:
+            cast_rows, crew_rows, link_rows = self.build_credits(movie_dict, movie_id)
+            wanted_cast.extend(cast_rows)
+            wanted_crew.extend(crew_rows)
+            wanted_links.extend(link_rows)
+
+        movie_ids = [movie_id for movie_dict, movie_id in changed]
+        # everyone credited before or after, since the title and year show on their pages too
+        self.changed_ids['Movie'].update(movie_ids)
+        self.changed_ids['Person'].update(self.credited_people(movie_ids))
+        self.changed_ids['Person'].update(row.person_id for row in wanted_cast + wanted_crew)
+
+        # keyed without the role, so a reworded role is updated in place and the credit keeps its starring_role
+        self.diff_rows(Cast, movie_ids, wanted_cast, key=lambda row: (row.movie_id, row.person_id),
+                       update_fields=['role'])
+        self.diff_rows(Crew, movie_ids, wanted_crew, key=lambda row: (row.movie_id, row.person_id, row.job_id))
+        self.diff_rows(MediaLink, movie_ids, wanted_links, key=lambda row: (row.movie_id, row.url_link),
+                       update_fields=['host', 'free', 'active'])
+
+    def credited_people(self, movie_ids):
+        people = set(Cast.objects.filter(movie_id__in=movie_ids).values_list('person_id', flat=True))
+        people.update(Crew.objects.filter(movie_id__in=movie_ids).values_list('person_id', flat=True))
+        return people
+
+    def diff_rows(self, model, movie_ids, wanted, key, update_fields=()):
+        """Make the model's rows for these movies match `wanted`, touching only the rows that differ"""
+        current = {}
+        stale = []
+        for row in model.objects.filter(movie_id__in=movie_ids):
+            if key(row) in current:
+                stale.append(row.id)    # duplicate credit, only one should survive
+            else:
+                current[key(row)] = row
+
+        to_insert, to_update = [], []
+        for row in wanted:
+            existing = current.pop(key(row), None)
+            if existing is None:
+                to_insert.append(row)
+            elif any(getattr(existing, field) != getattr(row, field) for field in update_fields):
+                row.id = existing.id
+                to_update.append(row)
+
+        # anything left in current is no longer in the source
+        stale.extend(row.id for row in current.values())
+
+        if stale:
+            model.objects.filter(id__in=stale).delete()
+        model.objects.bulk_create(to_insert, batch_size=self.batch_size)
+        if to_update:
+            model.objects.bulk_update(to_update, list(update_fields), batch_size=self.batch_size)
+
+        model_name = model.__name__
+        self.counts[model_name] += len(to_insert)
+        self.updated[model_name] += len(to_update)
+        self.deleted[model_name] += len(stale)
+
+    def remove_missing_movies(self, source_titles, prune):
+        """Movies in the db but not in the source are only deleted with prune, and never if users have touched them"""
+        missing = [(pk, name) for pk, name in Movie.objects.values_list('id', 'name') if name not in source_titles]
+        if not missing:
+            return
+
+        if not prune:
+            self.kept.extend(name for pk, name in missing)
+            return
+
+        missing_ids = [pk for pk, name in missing]
+        user_data = set(Review.objects.filter(movie_id__in=missing_ids).values_list('movie_id', flat=True))
+        user_data.update(UserMovieLink.objects.filter(movie_id__in=missing_ids).values_list('movie_id', flat=True))
+
+        doomed = [pk for pk in missing_ids if pk not in user_data]
+        self.kept.extend(name for pk, name in missing if pk in user_data)
+
+        self.changed_ids['Person'].update(self.credited_people(doomed))
+        with transaction.atomic():
+            for model in (Cast, Crew, MediaLink):
+                deleted, _ = model.objects.filter(movie_id__in=doomed).delete()
+                self.deleted[model.__name__] += deleted
+            deleted, _ = Movie.objects.filter(id__in=doomed).delete()
+            self.deleted['Movie'] += deleted
+
+    # --- reporting -----------------------------------------------------------------------------------------------
+
+    @property
+    def total_rows(self):
+        return sum(self.counts.values()) + sum(self.updated.values()) + sum(self.deleted.values())
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.total_rows / self.elapsed
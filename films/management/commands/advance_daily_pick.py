@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from films.daily import advance, build_schedule, get_daily_pick
+from films.models import DailyPickSchedule
+
+
+class Command(BaseCommand):
+    help = "Move the home page's daily pick to the next movie in the rotation, if a day has passed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='advance even if the current pick is less than a day old')
+        parser.add_argument('--reshuffle', action='store_true',
+                            help='throw away the rest of the rotation and shuffle every movie into a new one')
+
+    def handle(self, *args, **options):
+        if options['reshuffle'] or not DailyPickSchedule.objects.exists():
+            count = build_schedule()
+            self.stdout.write('Shuffled {} movies into a new rotation'.format(count))
+
+        record = advance(force=options['force'])
+        if record is None:
+            self.stdout.write(self.style.WARNING('There are no movies to pick from'))
+            return
+
+        # warm the cache so the first visitor of the day doesn't pay for it
+        get_daily_pick()
+        self.stdout.write(self.style.SUCCESS('Daily pick #{}: {}'.format(record.daily_count, record.movie.display_name)))
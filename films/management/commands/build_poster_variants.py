@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from films.derivatives import needs_variants, build_many
+from films.models import Movie
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail / card / detail poster sizes in WebP and JPEG for movies that need them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='rebuild every movie, not just missing or stale ones')
+        parser.add_argument('--workers', type=int, default=4, help='threads used for resizing')
+
+    def handle(self, *args, **options):
+        movies = list(Movie.objects.exclude(poster_image=''))
+        if not options['all']:
+            movies = needs_variants(movies)
+
+        self.stdout.write('{} movies to process'.format(len(movies)))
+        written, failed = build_many(movies, workers=options['workers'])
+
+        for movie, error in failed:
+            self.stdout.write(self.style.WARNING('  could not resize poster for {}: {}'.format(movie.name, error)))
+        self.stdout.write(self.style.SUCCESS('Wrote {} poster variants'.format(written)))
@@ -0,0 +1,83 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from films.cache import invalidate_all
+from films.conditional import touch_all
+from films.models import Movie, PosterVariant
+from films.storage import poster_storage, is_hashed_name
+
+
+class Command(BaseCommand):
+    help = 'Delete poster files that no Movie or PosterVariant refers to; optionally rename legacy files by content hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rehash', action='store_true',
+                            help='first move posters saved under their original filenames to content-hash names')
+        parser.add_argument('--min-age', type=int, default=60,
+                            help="minutes a file must have existed before it can be deleted (protects imports "
+                                 "that have stored files but not yet saved the rows)")
+        parser.add_argument('--dry-run', action='store_true', help='only report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['rehash']:
+            self.rehash(Movie, 'poster_image', options['dry_run'])
+            self.rehash(PosterVariant, 'image', options['dry_run'])
+
+        referenced = set(Movie.objects.exclude(poster_image='').values_list('poster_image', flat=True))
+        referenced.update(PosterVariant.objects.values_list('image', flat=True))
+
+        cutoff = timezone.now() - timedelta(minutes=options['min_age'])
+        deleted = 0
+        kept_young = 0
+        for name in self.walk('posters'):
+            if name in referenced:
+                continue
+            if poster_storage.get_modified_time(name) > cutoff:
+                kept_young += 1
+                continue
+            if not options['dry_run']:
+                poster_storage.delete(name)
+            deleted += 1
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS('{} {} unreferenced files ({} kept, newer than {} minutes)'.format(
+            verb, deleted, kept_young, options['min_age'])))
+
+    def walk(self, directory):
+        """Every file name under `directory` in poster storage"""
+        if not poster_storage.exists(directory):
+            return
+        directories, files = poster_storage.listdir(directory)
+        for filename in files:
+            yield posixpath.join(directory, filename)
+        for subdirectory in directories:
+            yield from self.walk(posixpath.join(directory, subdirectory))
+
+    def rehash(self, model, field_name, dry_run):
+        """Re-save files with legacy names so they get content-hash names, then point the rows at them"""
+        rows = [row for row in model.objects.exclude(**{field_name: ''})
+                if not is_hashed_name(getattr(row, field_name).name)]
+
+        self.stdout.write('{} {} rows have legacy file names'.format(len(rows), model.__name__))
+        if dry_run or not rows:
+            return
+
+        renamed = []
+        for row in rows:
+            field_file = getattr(row, field_name)
+            if not poster_storage.exists(field_file.name):
+                self.stdout.write(self.style.WARNING('  missing file for {}: {}'.format(row, field_file.name)))
+                continue
+            with poster_storage.open(field_file.name, 'rb') as fob:
+                field_file.name = poster_storage.save(field_file.name, fob)
+            renamed.append(row)
+
+        with transaction.atomic():
+            model.objects.bulk_update(renamed, [field_name], batch_size=200)
+        invalidate_all()    # cached movie pages still have the old file names in them
+        touch_all()
+        # the old files are now unreferenced and are picked up by the gc pass
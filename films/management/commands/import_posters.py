@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from films.cache import invalidate_all
+from films.conditional import touch
+from films.derivatives import build_many
+from films.models import Movie
+from films.posters import PosterIndex, match_movies, copy_posters, IMAGE_DIR, EXACT, ALIAS, FUZZY, AMBIGUOUS, UNMATCHED
+
+
+class Command(BaseCommand):
+    help = 'Attach poster images to movies, matching files to titles through a single directory index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=IMAGE_DIR, help='directory of poster image files')
+        parser.add_argument('--workers', type=int, default=4, help='threads used to copy files into storage')
+        parser.add_argument('--cutoff', type=float, default=0.85, help='minimum similarity for a fuzzy match (0-1)')
+        parser.add_argument('--no-fuzzy', action='store_true', help='only attach exact and year-alias matches')
+        parser.add_argument('--replace', action='store_true', help='also re-attach movies that already have a poster')
+        parser.add_argument('--dry-run', action='store_true', help='report the matches without copying anything')
+        parser.add_argument('--no-variants', action='store_true',
+                            help="don't generate the resized poster variants (run build_poster_variants later)")
+
+    def handle(self, *args, **options):
+        try:
+            index = PosterIndex(options['dir'])
+        except OSError as e:
+            raise CommandError('Could not read poster directory: {}'.format(e))
+
+        movies = Movie.objects.all()
+        if not options['replace']:
+            movies = movies.filter(poster_image='')
+        results = match_movies(movies.values_list('id', 'name'), index, cutoff=options['cutoff'])
+
+        attach_kinds = [EXACT, ALIAS] if options['no_fuzzy'] else [EXACT, ALIAS, FUZZY]
+        to_attach = [match for kind in attach_kinds for match in results[kind]]
+
+        self.report(index, results)
+
+        if options['dry_run'] or not to_attach:
+            return
+
+        movie_objects = Movie.objects.in_bulk([movie_id for movie_id, name, filename, candidates in to_attach])
+        pairs = [(movie_objects[movie_id], index.path(filename)) for movie_id, name, filename, candidates in to_attach]
+
+        updated = copy_posters(pairs, workers=options['workers'])
+
+        # one UPDATE per batch instead of a Movie.save() per poster
+        with transaction.atomic():
+            Movie.objects.bulk_update(updated, ['poster_image'], batch_size=200)
+        # bulk_update sends no post_save (and skips auto_now), so the cached movie pages have to be told
+        invalidate_all()
+        touch(Movie, [movie.id for movie in updated])
+
+        self.stdout.write(self.style.SUCCESS('Attached {} posters'.format(len(updated))))
+
+        if not options['no_variants']:
+            written, failed = build_many(updated, workers=options['workers'])
+            for movie, error in failed:
+                self.stdout.write(self.style.WARNING('  could not resize poster for {}: {}'.format(movie.name, error)))
+            self.stdout.write('Wrote {} poster variants'.format(written))
+
+    def report(self, index, results):
+        self.stdout.write('{} image files indexed'.format(len(index)))
+        self.stdout.write('  exact:     {}'.format(len(results[EXACT])))
+        self.stdout.write('  alias:     {}'.format(len(results[ALIAS])))
+        self.stdout.write('  fuzzy:     {}'.format(len(results[FUZZY])))
+        self.stdout.write('  ambiguous: {}'.format(len(results[AMBIGUOUS])))
+        self.stdout.write('  unmatched: {}'.format(len(results[UNMATCHED])))
+
+        for kind in [ALIAS, FUZZY]:
+            for movie_id, name, filename, candidates in results[kind]:
+                self.stdout.write('  [{}] {} -> {}'.format(kind, name, filename))
+
+        for movie_id, name, filename, candidates in results[AMBIGUOUS]:
+            self.stdout.write(self.style.WARNING('  [ambiguous] {} could be: {}'.format(name, ', '.join(candidates))))
+
+        for movie_id, name, filename, candidates in results[UNMATCHED]:
+            hint = ' (closest: {})'.format(', '.join(candidates)) if candidates else ''
+            self.stdout.write(self.style.WARNING('  [unmatched] {}{}'.format(name, hint)))
+
+        if results['unused']:
+            self.stdout.write('{} files were not used: {}'.format(len(results['unused']), ', '.join(results['unused'])))
@@ -0,0 +1,64 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from films.journal import read_journal, last_run_id, summarize_journal
+
+
+class Command(BaseCommand):
+    help = 'Summarize or query the ingest failure journal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default=os.path.join(settings.BASE_DIR, 'json_data', 'ingest_journal.jsonl'),
+            help='path to the journal file',
+        )
+        parser.add_argument('--run', help='only look at this run id (default: the most recent run)')
+        parser.add_argument('--all-runs', action='store_true', help='look at every run in the journal')
+        parser.add_argument('--stage', help='only failures from this stage, e.g. add_cast')
+        parser.add_argument('--movie', help='only failures for movies whose title contains this text')
+        parser.add_argument('--list', action='store_true', help='print the matching failure records')
+        parser.add_argument('--top', type=int, default=10, help='how many movies / reasons to show in the summary')
+
+    def handle(self, *args, **options):
+        filename = options['file']
+        if not os.path.exists(filename):
+            raise CommandError('No journal found at {}'.format(filename))
+
+        run = None
+        if not options['all_runs']:
+            run = options['run'] or last_run_id(filename)
+
+        entries = read_journal(filename, run=run, stage=options['stage'], movie=options['movie'])
+
+        if options['list']:
+            for entry in entries:
+                if entry['type'] == 'fail':
+                    self.stdout.write('{ts}  {stage:<12} {movie} | {reason} | {entity}'.format(**entry))
+            return
+
+        fails = []
+        runs = []
+        for entry in entries:
+            if entry['type'] == 'run':
+                runs.append(entry)
+            else:
+                fails.append(entry)
+
+        self.stdout.write('Run: {}'.format(run or 'all'))
+        for run_entry in runs:
+            for stage, details in run_entry['stages'].items():
+                self.stdout.write('  {:<12} {:>6} processed {:>5} failed {:>8.2f}s'.format(
+                    stage, details['processed'], details['fails'], details['seconds']))
+
+        summary = summarize_journal(fails)
+        self.stdout.write('{} failures'.format(sum(summary['per_stage'].values())))
+
+        for (stage, reason), count in summary['per_reason'].most_common(options['top']):
+            self.stdout.write('  {:>5}  {} - {}'.format(count, stage, reason))
+
+        if summary['movies']:
+            self.stdout.write('Most affected movies:')
+            for movie, count in summary['movies'].most_common(options['top']):
+                self.stdout.write('  {:>5}  {}'.format(count, movie))
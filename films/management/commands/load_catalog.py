@@ -0,0 +1,152 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from films.cache import invalidate_all
+from films.conditional import touch
+from films.catalog import invalidate_movie_index, repair_free_links
+from films.journal import IngestJournal
+from films.loader import CatalogLoader, open_checkpoint
+from films.models import Movie, Person
+from films.ranking import rerank_all
+from films.search import invalidate_search_index
+from films.sharding import ShardedLoader, SHARD_SIZE, usable_workers
+from films.sources import iter_records, SourceFormatError
+
+
+class Command(BaseCommand):
+    help = 'Bulk load the people and movie json files into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--people', default=os.path.join(settings.BASE_DIR, 'json_data', 'fin_people_list.json'),
+            help='path to the people file (json array or NDJSON, optionally gzipped)',
+        )
+        parser.add_argument(
+            '--movies', default=os.path.join(settings.BASE_DIR, 'json_data', 'fin_movie_list.json'),
+            help='path to the movie file (json array or NDJSON, optionally gzipped)',
+        )
+        parser.add_argument(
+            '--journal', default=os.path.join(settings.BASE_DIR, 'json_data', 'ingest_journal.jsonl'),
+            help='jsonl file that failures are appended to',
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='rows per bulk_create batch')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='load movies with this many processes (full load only; SQLite always uses one)',
+        )
+        parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='movies per worker task')
+        parser.add_argument('--skip-people', action='store_true', help='only load movies (people are already in the db)')
+        parser.add_argument(
+            '--sync', action='store_true',
+            help='delta re-import: only insert, update or delete rows whose source records changed',
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='with --sync, delete movies (and uncredited people) that are no longer in the source; '
+                 'movies with reviews or user details are always kept',
+        )
+
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='ignore the checkpoints of an earlier, interrupted load and read the files from the start',
+        )
+        parser.add_argument('--no-checkpoint', action='store_true', help="don't record or resume from checkpoints")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['prune'] and not options['sync']:
+            raise CommandError('--prune only makes sense with --sync')
+
+        if options['workers'] < 1 or options['shard_size'] < 1:
+            raise CommandError('--workers and --shard-size must be at least 1')
+
+        workers = usable_workers(options['workers'])
+        if options['workers'] > 1 and options['sync']:
+            self.stdout.write(self.style.WARNING('--sync runs in a single process, ignoring --workers'))
+            workers = 1
+        elif workers < options['workers']:
+            self.stdout.write(self.style.WARNING('SQLite allows only one writer, loading in a single process'))
+
+        journal = IngestJournal(options['journal'])
+        if workers > 1:
+            loader = ShardedLoader(batch_size=options['batch_size'], journal=journal, workers=workers,
+                                   shard_size=options['shard_size'])
+        else:
+            loader = CatalogLoader(batch_size=options['batch_size'], journal=journal)
+        loader.load_jobs()
+
+        # a sync is already cheap to re-run, and sharded workers commit out of order, so only a plain
+        # single-process load keeps checkpoints
+        checkpoints = not (options['no_checkpoint'] or options['sync'] or workers > 1)
+
+        try:
+            if not options['skip_people']:
+                people = iter_records(options['people'])
+                if options['sync']:
+                    loader.sync_people(people)
+                else:
+                    loader.load_people(people, self.checkpoint(options['people'], checkpoints, options['restart']))
+
+            movies = iter_records(options['movies'])
+            if options['sync']:
+                loader.sync_movies(movies, prune=options['prune'])
+                if options['prune'] and not options['skip_people']:
+                    loader.prune_people()
+            else:
+                loader.load_movies(movies, self.checkpoint(options['movies'], checkpoints, options['restart']))
+        except (OSError, SourceFormatError) as e:
+            raise CommandError('Could not read catalog file: {}'.format(e))
+        finally:
+            journal.close()
+            # bulk writes skip the post_save signals that normally keep these fresh
+            invalidate_movie_index()
+            invalidate_search_index()
+            invalidate_all()
+
+        # bulk_update() skips auto_now, so mark the pages the load changed (new rows got theirs on insert);
+        # invalidate_all() above already moved every cache version, so there's nothing to bump per id
+        touch(Movie, loader.changed_ids['Movie'], bump=False)
+        touch(Person, loader.changed_ids['Person'], bump=False)
+
+        # new movies come in unranked, and a sync can change what's there
+        if loader.counts['Movie'] or loader.deleted['Movie']:
+            rerank_all()
+        if loader.counts['MediaLink'] or loader.updated['MediaLink'] or loader.deleted['MediaLink']:
+            repair_free_links()
+
+        for label, counter in [('inserted', loader.counts), ('updated', loader.updated), ('deleted', loader.deleted)]:
+            for model_name, count in sorted(counter.items()):
+                if count:
+                    self.stdout.write('  {:<10} {:>7} rows {}'.format(model_name, count, label))
+        for model_name, count in sorted(loader.resumed.items()):
+            self.stdout.write('  {:<10} {:>7} committed by an earlier run, resumed after them'.format(model_name, count))
+        for model_name, count in sorted(loader.skipped.items()):
+            self.stdout.write('  {:<10} {:>7} unchanged / already present, skipped'.format(model_name, count))
+        if loader.kept:
+            self.stdout.write(self.style.WARNING('{} movies are no longer in the source but were kept: {}'.format(
+                len(loader.kept), ', '.join(loader.kept[:10]))))
+
+        self.stdout.write(self.style.SUCCESS('Wrote {} rows in {:.2f}s ({:.0f} rows/sec)'.format(
+            loader.total_rows, loader.elapsed, loader.rows_per_second)))
+
+        for stage, details in journal.summary()['stages'].items():
+            self.stdout.write('  {:<12} {:>6} processed {:>5} failed {:>8.2f}s'.format(
+                stage, details['processed'], details['fails'], details['seconds']))
+
+        if loader.flog.fail_log:
+            self.stdout.write(self.style.WARNING(
+                '{} records had failures, run: manage.py ingest_journal --run {}'.format(
+                    len(loader.flog.fail_log), journal.run_id)))
+
+    def checkpoint(self, filename, enabled, restart):
+        if not enabled:
+            return None
+        checkpoint = open_checkpoint(filename, restart=restart)
+        if checkpoint.finished:
+            self.stdout.write('{} was already loaded completely (use --restart to read it again)'.format(filename))
+        elif checkpoint.offset:
+            self.stdout.write('Resuming {} after {} records'.format(filename, checkpoint.offset))
+        return checkpoint
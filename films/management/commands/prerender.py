@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from films.prerender import prerender
+
+
+class Command(BaseCommand):
+    help = 'Write the public catalog pages to HTML files for the web server, rewriting only pages that changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.PRERENDER_ROOT, help='directory to write the pages to')
+        parser.add_argument('--all', action='store_true', help='rewrite every page, not just changed ones')
+        parser.add_argument('--workers', type=int, default=4, help='processes used for rendering (1 renders inline)')
+        parser.add_argument('--host', help='Host header to render with (default: the first ALLOWED_HOSTS entry)')
+
+    def handle(self, *args, **options):
+        written, unchanged, removed, failed = prerender(
+            options['output'], workers=options['workers'], host=options['host'], everything=options['all'])
+
+        for url, error in failed:
+            self.stdout.write(self.style.WARNING('  could not prerender {}: {}'.format(url, error)))
+        self.stdout.write(self.style.SUCCESS('Wrote {} pages to {} ({} unchanged, {} removed)'.format(
+            written, options['output'], unchanged, removed)))
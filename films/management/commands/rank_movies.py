@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from films.ranking import rerank_all, top_movies, mean_rating
+
+
+class Command(BaseCommand):
+    help = 'Recompute every movie\'s Bayesian score and write Movie.rank'
+
+    def handle(self, *args, **options):
+        changed = rerank_all()
+        self.stdout.write(self.style.SUCCESS('Reranked: {} movies changed score or rank (site mean {:.2f})'.format(
+            changed, mean_rating())))
+        for movie in top_movies(5):
+            self.stdout.write('  {:>3}  {:<40} {:.3f}'.format(movie.rank, movie.display_name, movie.score))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from films.catalog import repair_free_links
+
+
+class Command(BaseCommand):
+    help = 'Recompute Movie.has_free_link and the free movie count from the MediaLink table'
+
+    def handle(self, *args, **options):
+        fixed, count = repair_free_links()
+        style = self.style.WARNING if fixed else self.style.SUCCESS
+        self.stdout.write(style('{} flags corrected, {} movies with a free link'.format(fixed, count)))
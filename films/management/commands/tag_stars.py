@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from films.cache import MOVIE, PERSON, bump_on_commit
+from films.conditional import touch
+from films.models import Movie, Person
+from films.update_functions import STARS, resolve_people, starring_credits, starring_diff, tag_starring_roles
+
+
+class Command(BaseCommand):
+    help = "Mark every Cast credit of the given stars as a starring role, with one set-based UPDATE"
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='star names (default: the STARS list in update_functions.py)')
+        parser.add_argument('--file', help='text file with one star name per line (# starts a comment)')
+        parser.add_argument('--reset', action='store_true',
+                            help='also clear starring_role on credits of anyone not in the list')
+        parser.add_argument('--dry-run', action='store_true', help='show what would change without writing')
+
+    def handle(self, *args, **options):
+        names = list(options['names'])
+        if options['file']:
+            try:
+                with open(options['file']) as fob:
+                    names.extend(line.split('#')[0].strip() for line in fob)
+            except OSError as e:
+                raise CommandError('Could not read {}: {}'.format(options['file'], e))
+        names = [name for name in names if name] or STARS
+
+        matched, ambiguous, unmatched = resolve_people(names)
+
+        for name, candidates in ambiguous.items():
+            self.stdout.write(self.style.WARNING('  [ambiguous] {}: {}'.format(
+                name, ', '.join('{} (id {})'.format(n, pk) for pk, n in candidates))))
+        for name, suggestions in unmatched.items():
+            hint = ' (did you mean: {})'.format(', '.join(suggestions)) if suggestions else ''
+            self.stdout.write(self.style.WARNING('  [unmatched] {}{}'.format(name, hint)))
+        for name, (pk, person_name) in matched.items():
+            if name != person_name:
+                self.stdout.write('  [normalized] {} -> {}'.format(name, person_name))
+
+        self.stdout.write('{} of {} names resolved'.format(len(matched), len(names)))
+        if options['reset'] and (ambiguous or unmatched):
+            # reset clears everyone not in the list, so a name that didn't resolve would lose its starring roles
+            raise CommandError('--reset needs every name to match exactly one person; fix the names above first')
+
+        person_ids = [pk for pk, name in matched.values()]
+
+        if options['dry_run']:
+            to_mark, to_unmark = starring_diff(person_ids, reset=options['reset'])
+            names_by_id = dict(Person.objects.filter(id__in=set(to_mark) | set(to_unmark)).values_list('id', 'name'))
+            for person_id, count in sorted(to_mark.items(), key=lambda item: names_by_id[item[0]]):
+                self.stdout.write('  + {:<30} {} credits'.format(names_by_id[person_id], count))
+            for person_id, count in sorted(to_unmark.items(), key=lambda item: names_by_id[item[0]]):
+                self.stdout.write('  - {:<30} {} credits'.format(names_by_id[person_id], count))
+            self.stdout.write('Would mark {} and unmark {} Cast rows'.format(
+                sum(to_mark.values()), sum(to_unmark.values())))
+            return
+
+        with transaction.atomic():
+            credits = starring_credits(person_ids, reset=options['reset'])
+            marked, unmarked = tag_starring_roles(person_ids, reset=options['reset'])
+
+            # update() sends no signals (and skips auto_now), so the cached pages and ETags have to be told
+            movie_ids = {movie_id for movie_id, person_id in credits}
+            credited_ids = {person_id for movie_id, person_id in credits}
+            for movie_id in movie_ids:
+                bump_on_commit(MOVIE, movie_id)
+            for person_id in credited_ids:
+                bump_on_commit(PERSON, person_id)
+            touch(Movie, movie_ids)
+            touch(Person, credited_ids)
+
+        self.stdout.write(self.style.SUCCESS('Marked {} and unmarked {} Cast rows'.format(marked, unmarked)))
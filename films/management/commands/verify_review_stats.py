@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from films.models import Movie
+from films.ranking import rerank_all
+from films.review_stats import recompute_review_stats
+
+
+class Command(BaseCommand):
+    help = "Check every movie's running review totals against a recount of the Review table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='write the recounted values for movies that are off')
+
+    def handle(self, *args, **options):
+        stale = recompute_review_stats(fix=options['fix'])
+
+        if not stale:
+            self.stdout.write(self.style.SUCCESS('All review totals match'))
+            return
+
+        names = Movie.objects.filter(id__in=stale[:10]).values_list('name', flat=True)
+        self.stdout.write(self.style.WARNING('{} movies had totals that did not match: {}'.format(
+            len(stale), ', '.join(names))))
+        if options['fix']:
+            rerank_all()
+            self.stdout.write(self.style.SUCCESS('Recounted and reranked'))
+        else:
+            self.stdout.write('Run again with --fix to correct them')
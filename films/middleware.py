@@ -0,0 +1,115 @@
+"""Whole-page cache for anonymous visitors to the catalog pages.
+
+Visitors without a session get the same HTML for a movie or person page, so the rendered response is kept in the
+shared cache and handed back before the session, auth and view machinery runs at all. Each cacheable page is
+tagged with surrogate keys (PAGE_KEYS): 'movie:12', 'person:7', 'index', 'free_list', 'catalog'. Those are the
+same version numbers cache.py keeps for the page data, so the signals that bump a movie's version also purge
+its cached pages, and nothing else. The versions are read before the view runs and stored with the response;
+a change that lands while the page is being rendered makes the stored copy stale straight away.
+
+Requests carrying a session (or a pending message) always go to the view, and so do requests with any query
+string other than a plain ?page=N (?utm_source=..., ?x=1, ?page=007), so nobody can fill the cache with endless
+variants of one page. Responses that set a cookie, aren't a 200, or are marked private are never stored. The
+keys are also sent as a Surrogate-Key header, for a CDN in front of the site to purge by. A hit still answers If-None-Match / If-Modified-Since from the ETag and
+Last-Modified the view set (see conditional.py), so a revisit gets a 304 without even the page body.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import parse_http_date_safe
+
+from . import cache
+
+# url name (in the films namespace) -> the surrogate keys of that page
+PAGE_KEYS = {
+    'index': lambda kwargs: ['index'],
+    'all_movies': lambda kwargs: ['catalog'],
+    'free_movies': lambda kwargs: ['free_list'],
+    'movie': lambda kwargs: ['movie:{}'.format(kwargs['pk']), 'movie_reviews:{}'.format(kwargs['pk'])],
+    'person': lambda kwargs: ['person:{}'.format(kwargs['pk'])],
+    'faq': lambda kwargs: [],
+}
+
+
+def cacheable_query(request):
+    """Nothing, or a single canonical page number: the only query parameter any of those pages reads"""
+    if not request.GET:
+        return True
+    pages = request.GET.getlist('page')
+    return len(request.GET) == 1 and len(pages) == 1 and pages[0].isdigit() and pages[0] == str(int(pages[0]))
+
+
+def page_cache_key(request):
+    key = '{}?page={}'.format(request.path, request.GET.get('page', ''))
+    return 'films:response:{}'.format(hashlib.md5(key.encode()).hexdigest())
+
+
+def surrogate_keys(request):
+    """The page's surrogate keys, or None if it isn't a page we cache"""
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    if match.namespace != 'films' or match.url_name not in PAGE_KEYS:
+        return None
+    return PAGE_KEYS[match.url_name](match.kwargs)
+
+
+def key_versions(keys):
+    # 'movie:12' is the version cache.py keeps as (MOVIE, 12); 'index' is ('index', 0)
+    depends = [tuple(key.split(':', 1)) if ':' in key else (key, 0) for key in keys]
+    return cache.get_versions([cache.EVERYTHING] + depends)
+
+
+class AnonymousPageCacheMiddleware():
+    """Goes right after SecurityMiddleware, so a hit skips everything below it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.bypass_cookies = {settings.SESSION_COOKIE_NAME, 'messages'}
+
+    def __call__(self, request):
+        keys = None
+        if (request.method in ('GET', 'HEAD') and not self.bypass_cookies.intersection(request.COOKIES) and
+                cacheable_query(request)):
+            keys = surrogate_keys(request)
+        if keys is None:
+            return self.get_response(request)
+
+        cache_key = page_cache_key(request)
+        versions = key_versions(keys)
+
+        stored = shared_cache.get(cache_key)
+        if stored is not None and stored[0] == versions:
+            cache.stats['page_hits'] += 1
+            response = stored[1]
+            last_modified = response.get('Last-Modified')
+            return get_conditional_response(
+                request, etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(last_modified) if last_modified else None,
+                response=response,
+            )
+        cache.stats['page_misses'] += 1
+
+        response = self.get_response(request)
+        if keys:
+            response['Surrogate-Key'] = ' '.join(keys)
+        patch_vary_headers(response, ['Cookie'])
+
+        if self.can_store(request, response):
+            timeout = getattr(response, 'page_cache_timeout', cache.PAGE_TIMEOUT)
+            shared_cache.set(cache_key, (versions, response), timeout)
+        return response
+
+    def can_store(self, request, response):
+        return (
+            request.method == 'GET' and
+            response.status_code == 200 and
+            not response.cookies and
+            not getattr(response, 'streaming', False) and
+            'private' not in response.get('Cache-Control', '')
+        )
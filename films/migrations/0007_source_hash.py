@@ -0,0 +1,23 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0006_cast_starring_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='source_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0007_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PosterVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(choices=[('thumb', 'Thumbnail'), ('card', 'Card'), ('detail', 'Detail')], max_length=10)),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('image', models.ImageField(height_field='height', upload_to='posters/variants/', width_field='width')),
+                ('width', models.PositiveIntegerField(default=0)),
+                ('height', models.PositiveIntegerField(default=0)),
+                ('source_name', models.CharField(default='', max_length=200)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='poster_variants', to='films.Movie')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='postervariant',
+            constraint=models.UniqueConstraint(fields=('movie', 'size', 'format'), name='one_variant_per_size_format'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:38
+
+from django.db import migrations, models
+import films.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0008_postervariant'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='poster_image',
+            field=models.ImageField(blank=True, storage=films.storage.ContentAddressedStorage(), upload_to='posters/'),
+        ),
+        migrations.AlterField(
+            model_name='postervariant',
+            name='image',
+            field=models.ImageField(height_field='height', storage=films.storage.ContentAddressedStorage(), upload_to='posters/variants/', width_field='width'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0009_content_addressed_posters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True)),
+                ('source_hash', models.CharField(max_length=64)),
+                ('offset', models.PositiveIntegerField(default=0)),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0010_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPickSchedule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(unique=True)),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='films.Movie')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
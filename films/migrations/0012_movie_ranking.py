@@ -0,0 +1,23 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0011_dailypickschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='score',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='rank',
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:50
+
+from django.db import migrations, models
+
+
+def set_free_links(apps, schema_editor):
+    """Fill in the new flag and counter for the movies already in the db"""
+    Movie = apps.get_model('films', 'Movie')
+    MediaLink = apps.get_model('films', 'MediaLink')
+    SiteCounter = apps.get_model('films', 'SiteCounter')
+
+    free_movie_ids = MediaLink.objects.filter(free=True).values('movie_id')
+    count = Movie.objects.filter(id__in=free_movie_ids).update(has_free_link=True)
+    SiteCounter.objects.create(name='free_movies', value=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0012_movie_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('value', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='has_free_link',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(set_free_links, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 3.0.8 on 2026-10-18 12:51
+
+import math
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def count_reviews(apps, schema_editor):
+    """Fill in the running totals for the movies already in the db"""
+    Movie = apps.get_model('films', 'Movie')
+    Review = apps.get_model('films', 'Review')
+
+    counts = Review.objects.values('movie_id').annotate(
+        num_reviews=Count('id'),
+        rating_total=Sum('star_rating'),
+        **{'stars_{}'.format(stars): Count('id', filter=Q(star_rating=stars)) for stars in range(1, 6)}
+    )
+    for row in counts:
+        movie_id = row.pop('movie_id')
+        row['avg_rating'] = math.floor(row['rating_total'] * 10 / row['num_reviews'] + 0.5) / 10
+        Movie.objects.filter(id=movie_id).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0013_free_link_flag'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='rating_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='stars_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='movie',
+            name='num_reviews',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_reviews, migrations.RunPython.noop),
+    ]
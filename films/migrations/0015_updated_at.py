@@ -0,0 +1,23 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0014_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
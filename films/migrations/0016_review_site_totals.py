@@ -0,0 +1,25 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:40
+
+from django.db import migrations
+from django.db.models import Count, Sum
+
+
+def count_site_totals(apps, schema_editor):
+    """Start the site-wide review counters from the reviews already in the db"""
+    Review = apps.get_model('films', 'Review')
+    SiteCounter = apps.get_model('films', 'SiteCounter')
+
+    totals = Review.objects.aggregate(num_reviews=Count('id'), rating_total=Sum('star_rating'))
+    SiteCounter.objects.update_or_create(name='reviews', defaults={'value': totals['num_reviews']})
+    SiteCounter.objects.update_or_create(name='rating_total', defaults={'value': totals['rating_total'] or 0})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0015_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_site_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.8 on 2026-10-18 13:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films', '0016_review_site_totals'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movie',
+            name='score',
+            field=models.FloatField(db_index=True, editable=False, null=True),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings                         # so we can use AUTH_USER_MODEL, per django docs
 # from django.contrib.auth import get_user_model         # learndjango version
 from django.urls import reverse
@@ -6,6 +6,8 @@ from django.utils import timezone
 from django.utils.text import slugify
 from random import sample
 
+from .storage import poster_storage
+
 #  person MUST be defined first, because Movie uses it (via references)
 class Person(models.Model):
     """A person in the database"""
@@ -23,6 +25,12 @@ class Person(models.Model):
     #primary_occupation = models.CharField(max_length=80)
     bio_summary = models.TextField(default='', blank=True)
 
+    # fingerprint of the source json record this row was loaded from; used by load_catalog --sync
+    source_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
+
+    # last change to the person or anything on their page (credits, titles); see conditional.py
+    updated_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = ['name']             # is this working? when?
         verbose_name_plural = 'people'
@@ -61,24 +69,40 @@ class Movie(models.Model):
         max_length=150,
         )
 
-    poster_image = models.ImageField(upload_to='posters/', blank=True) # remember that TYPE effects behavior of null= and blank=!
+    # files are named by content hash (see storage.py), so the same image is only ever stored once
+    poster_image = models.ImageField(upload_to='posters/', blank=True, storage=poster_storage) # remember that TYPE effects behavior of null= and blank=!
 
     film_summary = models.TextField(default='', blank=True)
 
     all_cast = models.ManyToManyField(Person, through='Cast', related_name='movies_cast')
     all_crew = models.ManyToManyField(Person, through='Crew', related_name='movies_crew')
 
-    # you need to write a method for this class that checks its status each time its loaded, and updates
-    # these attributes accordingly.
-    rank = models.PositiveIntegerField(null=True)
+    # position by Bayesian-weighted rating, 1 = best; rewritten by ranking.rerank_all(), while the score also
+    # follows each review (rescore_movie)
+    rank = models.PositiveIntegerField(null=True, db_index=True)
+    score = models.FloatField(null=True, db_index=True, editable=False)
 
-    # these will be updated by update_review_details method
-    num_reviews = models.PositiveIntegerField(null=True)
-    avg_rating = models.FloatField(null=True)   # look into using DecimalField instead, though it has some
-                                                # required arguments and might have issues with SQLite !!
+    # last change to the movie or anything on its page (credits, links, reviews); see conditional.py
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    # running review aggregates, adjusted in place with F() expressions as reviews come and go (review_stats.py)
+    num_reviews = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)       # sum of all star ratings
+    stars_1 = models.PositiveIntegerField(default=0)            # how many reviews gave each number of stars
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(null=True)   # rating_total / num_reviews to 1 place, None with no reviews
 
     user_notes = models.ManyToManyField(settings.AUTH_USER_MODEL, through='UserMovieLink', related_name='movies_notes')
 
+    # fingerprint of the source json record (incl. cast, crew and media links); used by load_catalog --sync
+    source_hash = models.CharField(max_length=64, default='', blank=True, editable=False)
+
+    # True when at least one MediaLink is free; kept in step by signals.py (repair with manage.py repair_free_links)
+    has_free_link = models.BooleanField(default=False, db_index=True, editable=False)
+
     class Meta:
         ordering = ['year']  # this used to be name, make sure to migrate again 3/14
 
@@ -105,25 +129,16 @@ class Movie(models.Model):
             return self.name
 
     def update_review_details(self):
-        """Queries Review table to get all reviews of current movie object, then updates num_reviews and avg_rating"""
+        """Recount this movie's review aggregates from scratch; Review.save/delete adjust them incrementally"""
+        # imported here, review_stats.py and ranking.py import this module
+        from .review_stats import AGGREGATE_FIELDS, recompute_review_stats
+        from .ranking import rescore_movie
 
-        movie_reviews = Review.objects.filter(movie=self)
-        if movie_reviews.count() == 0:
-            self.avg_rating = None
-            self.num_reviews = None
-        else:
-            self.num_reviews = movie_reviews.count()
-            # get average of all reviews of this movie
-            agg_result = Review.objects.filter(movie=self).aggregate(star_average=models.Avg('star_rating'))
-            self.avg_rating = round(agg_result['star_average'], 1)  # would have been 'star_rating__avg' by default
-
-        self.save() # this is crucial! this originally wasn't working becuase I forgot this line!
-
-        # re: avg_rating above--
-        # round(x, 1) will round x to 1 decimal place; without this, I can get results like .6666666, etc
-        # add call to calculate_rank here, use it to update self.rank value...
+        recompute_review_stats(Movie.objects.filter(id=self.id))
+        self.refresh_from_db(fields=AGGREGATE_FIELDS)
+        rescore_movie(self)
 
-    def get_related_movies(self):
+    def get_related_movies(self, director=None):
         """a method to find three movies related to a given Movie instance; used with Daily Pick on front page"""
 
         # right now this works just on the director; later, if I add the 'starring' field to Movies, it will work
@@ -131,7 +146,8 @@ class Movie(models.Model):
 
         # TODO: figure out how to use F objects and/or select/prefectch_related to reduce database hits in this process!
 
-        director = self.all_crew.get(crew__job__job_title='Director')
+        if director is None:
+            director = self.all_crew.get(crew__job__job_title='Director')
         # starring    to be added later
 
         # get all movies by the same director
@@ -151,6 +167,46 @@ class Movie(models.Model):
         super().save(*args, **kwargs)
 
 
+class PosterVariant(models.Model):
+    """A resized copy of a Movie's poster_image, in one of the fixed sizes and formats (see derivatives.py)"""
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='poster_variants')
+
+    THUMB = 'thumb'
+    CARD = 'card'
+    DETAIL = 'detail'
+    size_choices = [
+        (THUMB, 'Thumbnail'),
+        (CARD, 'Card'),
+        (DETAIL, 'Detail'),
+    ]
+    size = models.CharField(max_length=10, choices=size_choices)
+
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    format_choices = [
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+    ]
+    format = models.CharField(max_length=10, choices=format_choices)
+
+    image = models.ImageField(upload_to='posters/variants/', width_field='width', height_field='height',
+                              storage=poster_storage)
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+
+    # poster_image.name this variant was made from; if the poster changes, the variant is stale
+    source_name = models.CharField(max_length=200, default='')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['movie', 'size', 'format'], name='one_variant_per_size_format')
+        ]
+
+    def __str__(self):
+        return '{} {} {} ({}x{})'.format(self.movie.name, self.size, self.format, self.width, self.height)
+
+
 class DailyMovie(models.Model):
 
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
@@ -178,6 +234,19 @@ class DailyMovie(models.Model):
         else:
             return True
 
+class DailyPickSchedule(models.Model):
+    """One slot of the shuffled rotation that the daily pick walks through (see daily.py)"""
+
+    position = models.PositiveIntegerField(unique=True)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['position']
+
+    def __str__(self):
+        return '#{} {}'.format(self.position, self.movie.display_name)
+
+
 class Cast(models.Model):
     person = models.ForeignKey(Person, on_delete=models.CASCADE)
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
@@ -290,17 +359,28 @@ class Review(models.Model):
         }
         return reverse('films:movie', kwargs=kwargs)
 
-    # override the save method so we can also call the relevant movie object's update method after the save
+    # override the save method so the movie's review aggregates move with the review, in the same transaction
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # after the save, update review details for movie that just got reviewed
-        self.movie.update_review_details()
+        from .review_stats import apply_review_change
+
+        with transaction.atomic():
+            # a re-save (e.g. from the admin) may have changed the rating or the movie, so take the old one out first
+            old = None
+            if not self._state.adding:
+                old = Review.objects.filter(pk=self.pk).values_list('movie_id', 'star_rating').first()
+
+            super().save(*args, **kwargs)
+            if old is None:
+                apply_review_change(self.movie_id, added=self.star_rating)
+            elif old[0] != self.movie_id:
+                apply_review_change(old[0], removed=old[1])
+                apply_review_change(self.movie_id, added=self.star_rating)
+            elif old[1] != self.star_rating:
+                apply_review_change(self.movie_id, added=self.star_rating, removed=old[1])
+
         self.check_uml_status()
 
-    def delete(self, *args, **kwargs):
-        super().delete(*args, **kwargs)
-        # update review details for movie on review delete, too...
-        self.movie.update_review_details()
+    # deletes (including cascades from a deleted user) are handled by the post_delete receiver in signals.py
 
     def check_uml_status(self):
         """this method simply creates and/or updates a UML object after a Review is written"""
@@ -340,7 +420,39 @@ class MediaLink(models.Model):
         return self.url_link
 
 
+class ImportCheckpoint(models.Model):
+    """How far load_catalog got through one source file, so an interrupted import can pick up where it stopped"""
+
+    source = models.CharField(max_length=255, unique=True)     # absolute path of the source file
+    source_hash = models.CharField(max_length=64)               # sha256 of the file; a changed file starts over
+    offset = models.PositiveIntegerField(default=0)             # records committed so far
+    chunks = models.PositiveIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{}: {} records{}'.format(self.source, self.offset, ' (finished)' if self.finished else '')
+
+    def advance(self, records):
+        """Record one more committed chunk; call inside the transaction that wrote it"""
+        self.offset += records
+        self.chunks += 1
+        self.save(update_fields=['offset', 'chunks', 'updated'])
+
+    def finish(self):
+        self.finished = True
+        self.save(update_fields=['finished', 'updated'])
 
 
+class SiteCounter(models.Model):
+    """A named, site-wide number that is kept up to date as rows change, instead of being counted per request"""
 
+    FREE_MOVIES = 'free_movies'     # movies with has_free_link, see catalog.py
+    REVIEWS = 'reviews'             # every Review on the site, see review_stats.py
+    RATING_TOTAL = 'rating_total'   # the sum of their star ratings; ranking.py's mean comes from these two
 
+    name = models.CharField(max_length=50, unique=True)
+    value = models.IntegerField(default=0)
+
+    def __str__(self):
+        return '{}: {}'.format(self.name, self.value)
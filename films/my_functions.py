@@ -1,10 +1,11 @@
-import os # used in add_movie_poster
 import json
 import re
 from datetime import date
-from django.core.files import File # used in add_movie_poster
+
+from django.db import transaction
 
 from .models import Person, Movie, Cast, Job, Crew, Review, UserMovieLink, MediaLink
+from .journal import IngestJournal, read_journal
 
 # order of script functions to populate the database, to run in the django shell:
 
@@ -16,10 +17,14 @@ from .models import Person, Movie, Cast, Job, Crew, Review, UserMovieLink, Media
 # 4. get_movies()   assign to all_movies
 # 5. create fail log:  flog = FailTracker()  only works on movie population, not people
 # 6. for loop on all_movies, call add_movie on each movie
-# 7. check for errors, as logged by the flog:  flog.fail_log
+# 7. check for errors, as logged by the flog:  flog.fail_log   (call flog.save_log() once at the end to
+#    append them to json_data/ingest_journal.jsonl; see manage.py ingest_journal to query it)
+
+# 8. python manage.py import_posters   (replaces looping add_movie_poster() from image_populator.py over
+#    every Movie object; that function is still there for fixing a single movie from the shell)
 
-# 8. import the add_movie_poster function from image_populator.py
-# 9. run a loop on all Movie objects, calling add_movie_poster() on each movie object
+# steps 1 - 7 are now handled in bulk by:  python manage.py load_catalog
+# (see loader.py); the functions below are kept for one-off fixes from the shell.
 
 # I think you are going to need to write a .py script that does ALL of the above
 # when executed from the command line. 
@@ -71,28 +76,52 @@ def get_people():
 
 
 class FailTracker():
+    """Collects failures per movie; each one is also appended to the ingest journal (see journal.py)"""
 
-    def __init__(self, dev_stage='testing'):
+    def __init__(self, dev_stage='testing', journal=None):
         self.dev_stage = dev_stage
         self.fail_log = {}
+        self.journal = journal if journal is not None else IngestJournal()
+
+    @staticmethod
+    def format_note(fail_note, stage='', entity=''):
+        note = fail_note
+        if stage:
+            note = '{} - {}'.format(stage, note)
+        if entity:
+            note = '{}, {}'.format(note, entity)
+        return note
 
-    def add_fail(self, movie_name, fail_note):
+    def add_fail(self, movie_name, fail_note, stage='', entity=''):
+
+        note = self.format_note(fail_note, stage, entity)
 
         if self.fail_log.get(movie_name): # check if movie key is already in dict
-            self.fail_log[movie_name].append(fail_note) # fail note is a single string
+            self.fail_log[movie_name].append(note) # fail note is a single string
         else:
-            self.fail_log[movie_name] = [fail_note]  # value is a list, so it can appended to if more fails are found.
+            self.fail_log[movie_name] = [note]  # value is a list, so it can appended to if more fails are found.
+
+        # buffered; the journal only touches the disk every flush_every records
+        self.journal.record(movie_name, stage, fail_note, entity)
+
+    def merge(self, entries):
+        """Add failure records collected elsewhere (journal entries) to this tracker and its journal"""
+        for entry in entries:
+            note = self.format_note(entry['reason'], entry['stage'], entry['entity'])
+            self.fail_log.setdefault(entry['movie'], []).append(note)
+        self.journal.merge(entries)
 
     def save_log(self):
-        """Store the fail_log dictionary locally"""
-        filename = 'json_data/fail_log.json'
-        with open(filename, 'w') as fob:
-            json.dump(self.fail_log, fob)
+        """Append any buffered failures to the journal file. Nothing already written is re-serialized."""
+        self.journal.flush()
 
     def load_local_log(self):
-        filename = 'json_data/fail_log.json'
-        with open(filename) as fob:
-            fails = json.load(fob)
+        """Rebuild the movie -> [fail notes] dict from the journal file"""
+        self.journal.flush()
+        fails = {}
+        for entry in read_journal(self.journal.filename, entry_type='fail'):
+            note = '{} - {}, {}'.format(entry['stage'], entry['reason'], entry['entity'])
+            fails.setdefault(entry['movie'], []).append(note)
 
         return fails
 
@@ -102,12 +131,14 @@ def get_year(release_date, title, flog):
     try:
         p = re.compile(r'\d{4}$')
     except:
-        fail_note = 'get_year failed'
-        flog.add_fail(title, fail_note)
-        flog.save_log()
+        flog.add_fail(title, 'regex compile failed', stage='get_year')
         return None
     else:
-        return int(p.findall(release_date)[0])
+        matches = p.findall(release_date)
+        if not matches:
+            flog.add_fail(title, 'no year in release date', stage='get_year', entity=release_date)
+            return None
+        return int(matches[0])
 
 
 def add_movie(movie_dict, flog):
@@ -132,9 +163,8 @@ def add_movie(movie_dict, flog):
         try:
             based_on = '{} by {}'.format(movie_dict['based on'][0], movie_dict['based on'][1])
         except:
-            fail_note = 'add_movie - "Based On" list extraction failed for movie {}'.format(title)
-            flog.add_fail(title, fail_note)
-            flog.save_log()
+            flog.add_fail(title, '"Based On" list extraction failed', stage='add_movie')
+            based_on = 'n/a'
         else:
             based_on = based_on.title() # this makes the 'by' get capitalized, which I don't like. 
 
@@ -151,28 +181,27 @@ def add_movie(movie_dict, flog):
     try: 
         movie = Movie(name=title, display_name=display_name, year=year, release_date=release_date, studio=studio, based_on=based_on)
     except:
-        fail_note = 'add_movie - Movie() call, {}'.format(title)
-        flog.add_fail(title, fail_note)
-        flog.save_log()
+        flog.add_fail(title, 'Movie() call', stage='add_movie')
 
     # clearly we aren't going to try to add_cast and add_crew if the Movie() call failed        
     else:
-        movie.save()
-        # grab the pk of the movie record we just created above ... why though? what is this used for?
-        movie_id = movie.id # this must be from some older version; it's apparently not used at all now
+        # the movie and all of its credits go in together; a crash halfway through used to leave a movie
+        # with only part of its cast and crew
+        with transaction.atomic():
+            movie.save()
 
-        # cast connections
-        for actor_role_pair in cast_list:
-            add_cast_member(actor_role_pair, movie, flog)
+            # cast connections
+            for actor_role_pair in cast_list:
+                add_cast_member(actor_role_pair, movie, flog)
 
-        # crew connections
-        for crew_job_pair in crew_list:
-            add_crew_member(crew_job_pair, movie, flog)
+            # crew connections
+            for crew_job_pair in crew_list:
+                add_crew_member(crew_job_pair, movie, flog)
 
-        # add media links, but only if at least 1 is preset.
-        if media_links:
-            for media_dict in media_links:
-                add_media_link(movie, media_dict)
+            # add media links, but only if at least 1 is preset.
+            if media_links:
+                for media_dict in media_links:
+                    add_media_link(movie, media_dict)
 
 
 def add_media_link(movie, media_dict):
@@ -197,17 +226,13 @@ def add_cast_member(actor_role_pair, movie, flog):
         person = Person.objects.get(name=person_name)
 
     except:
-        fail_note = 'add_cast - Person linkage, {}, {}'.format(person_name, person_role)
-        flog.add_fail(movie.name, fail_note)
-        flog.save_log()
+        flog.add_fail(movie.name, 'Person linkage', stage='add_cast', entity='{}, {}'.format(person_name, person_role))
 
     else:
         try: 
             cast_credit = Cast(person=person, movie=movie, role=person_role)
         except:
-            fail_note = 'add_cast - Cast() call, {}, {}'.format(person_name, person_role)
-            flog.add_fail(movie.name, fail_note)
-            flog.save_log()
+            flog.add_fail(movie.name, 'Cast() call', stage='add_cast', entity='{}, {}'.format(person_name, person_role))
         else:
             cast_credit.save()
         # note on above: you could pass the person object itself, using person_id or person.id, for same result.
@@ -255,25 +280,19 @@ def add_crew_member(crew_job_pair, movie, flog):
         job = Job.objects.get(job_title=crew_type)
 
     except:
-        fail_note = 'add_crew - Job linkage, {}, {}'.format(crew_name, crew_type)
-        flog.add_fail(movie.name, fail_note)
-        flog.save_log()
+        flog.add_fail(movie.name, 'Job linkage', stage='add_crew', entity='{}, {}'.format(crew_name, crew_type))
     
     else:
         # we don't want to add the person if we couldn't find what job they had, so this is indented
         try:
             person = Person.objects.get(name=crew_name)
         except:
-            fail_note = 'add_crew - Person linkage, {}, {}'.format(crew_name, crew_type)
-            flog.add_fail(movie.name, fail_note)
-            flog.save_log()
+            flog.add_fail(movie.name, 'Person linkage', stage='add_crew', entity='{}, {}'.format(crew_name, crew_type))
         else:
             try:
                 crew_credit = Crew(person=person, movie=movie, job=job)
             except:
-                fail_note = 'add_crew - Crew() call, {}, {}'.format(crew_name, crew_type)
-                flog.add_fail(movie.name, fail_note)
-                flog.save_log()
+                flog.add_fail(movie.name, 'Crew() call', stage='add_crew', entity='{}, {}'.format(crew_name, crew_type))
             else:
                 crew_credit.save()  # you might need to put the .sav() call in the try block
 
@@ -313,47 +332,6 @@ def add_person(person_dict):
     person.save()
 
 
-def add_movie_poster(movie_object):
-    """find and update the image field for a single movie object"""
-
-    # this references directories on my local system. but, I'll need to run this to populate my db with
-    # images once deployed to a server; how will I tell this function where to look to find them?
-
-    all_image_files = os.listdir('films/image_downloads/') # simply lists names of the files, as strings
-
-    movie_name = movie_object.name
-
-    matching_image = None # this will simply be a string, used to access the appropriate file
-
-    # compare each image string against the name of the movie, to find a match
-    for image in all_image_files:
-        if movie_name.lower() in image.lower():
-            matching_image = image
-
-    if matching_image:
-
-        path_start = 'films/image_downloads/'
-        filepath = '{}{}'.format(path_start, matching_image)
-
-        image_object = open(filepath, 'rb')
-
-        django_object = File(image_object)   # no need to call .read() on the opened object, django File() takes care of that.
-
-        movie_object.poster_image.save(matching_image, django_object) # use of 'matching image' here: provides filename to save as
-
-        image_object.close()
-
-        print('Successfully added {} to {}'.format(matching_image, movie_name))
-
-    else:
-        print('No matching image file was found for the movie named {}'.format(movie_name))
-
-
-    # notably, there is no .save() call here on the movie object itself; does the .save() on the image
-    # automatically save the object, too? or did I run a .save() in my for loop that calls this function,
-    # previous? I'm guessing the former.....well, I just ran the function, and all the movies have images,
-    # so that call to save on the poster_image field must also save the object itself, interesting!
-
 # Job pks:
 
 # Director 2
@@ -0,0 +1,136 @@
+"""Matching poster image files to movies, used by the import_posters command and add_movie_poster().
+
+The old add_movie_poster() listed the image directory once per movie and substring-matched every filename,
+keeping the last hit, so 'Bait (1954)' ended up with 'Jail Bait (1954).png'. Here the directory is read once into
+an index of normalized title -> filenames, and movies are matched on the whole normalized title. Only when that
+fails do we fall back to the title without its '(year)' and then to a fuzzy match, and both of those are
+reported so a person can check them.
+"""
+
+import difflib
+import os
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+
+from .text import normalize_text
+
+IMAGE_DIR = os.path.join(settings.BASE_DIR, 'films', 'image_downloads')
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg'}
+
+YEAR_SUFFIX = re.compile(r'\s*\d{4}$')
+
+EXACT = 'exact'
+ALIAS = 'alias'        # matched once the '(year)' was dropped from one side
+FUZZY = 'fuzzy'
+AMBIGUOUS = 'ambiguous'
+UNMATCHED = 'unmatched'
+
+
+def normalize_title(text):
+    """'Cry Terror!' and 'cry terror' compare equal"""
+    return normalize_text(text)
+
+
+def strip_year(key):
+    return YEAR_SUFFIX.sub('', key)
+
+
+class PosterIndex():
+    """One listing of the image directory, keyed by normalized title"""
+
+    def __init__(self, directory=IMAGE_DIR):
+        self.directory = directory
+        self.by_key = defaultdict(list)
+        self.by_alias = defaultdict(list)
+
+        for filename in sorted(os.listdir(directory)):
+            stem, extension = os.path.splitext(filename)
+            if extension.lower() not in IMAGE_EXTENSIONS:
+                continue
+            key = normalize_title(stem)
+            self.by_key[key].append(filename)
+            self.by_alias[strip_year(key)].append(filename)
+
+        self.keys = list(self.by_key)
+
+    def __len__(self):
+        return sum(len(files) for files in self.by_key.values())
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def match(self, title, cutoff=0.85):
+        """Return (kind, filename or None, candidates) for one movie title"""
+        key = normalize_title(title)
+
+        files = self.by_key.get(key, [])
+        if len(files) == 1:
+            return EXACT, files[0], files
+        if len(files) > 1:
+            return AMBIGUOUS, None, files
+
+        # 'The Lawless' vs 'The Lawless (1950).jpg', or the other way around
+        files = self.by_alias.get(strip_year(key), [])
+        if len(files) == 1:
+            return ALIAS, files[0], files
+        if len(files) > 1:
+            return AMBIGUOUS, None, files
+
+        scored = sorted(
+            ((difflib.SequenceMatcher(None, key, other).ratio(), other) for other in
+             difflib.get_close_matches(key, self.keys, n=3, cutoff=0.6)),
+            reverse=True,
+        )
+        candidates = [self.by_key[other][0] for score, other in scored]
+
+        if not scored or scored[0][0] < cutoff:
+            return UNMATCHED, None, candidates
+        # two near-equal candidates is a coin toss, so don't pick either
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < 0.05:
+            return AMBIGUOUS, None, candidates
+        return FUZZY, candidates[0], candidates
+
+
+def match_movies(movies, index, cutoff=0.85):
+    """Match (id, name) pairs against the index; returns {kind: [(movie_id, name, filename, candidates)]}
+
+    A file can only go to one movie: if an exact match claims it, any looser match on the same file is
+    downgraded to ambiguous.
+    """
+    results = defaultdict(list)
+    claimed = {}
+
+    matches = [(movie_id, name) + index.match(name, cutoff) for movie_id, name in movies]
+
+    # exact matches get first claim on their files
+    for movie_id, name, kind, filename, candidates in sorted(matches, key=lambda m: m[2] != EXACT):
+        if filename is not None and filename in claimed:
+            results[AMBIGUOUS].append((movie_id, name, None, [filename]))
+            continue
+        if filename is not None:
+            claimed[filename] = name
+        results[kind].append((movie_id, name, filename, candidates))
+
+    results['unused'] = sorted(set(f for files in index.by_key.values() for f in files) - set(claimed))
+    return results
+
+
+def copy_poster(movie, path):
+    """Save one image file into the movie's poster_image storage, without saving the movie row itself"""
+    with open(path, 'rb') as fob:
+        movie.poster_image.save(os.path.basename(path), File(fob), save=False)
+    return movie
+
+
+def copy_posters(pairs, workers=4):
+    """Copy (movie, path) pairs through a thread pool; returns the movies with their new poster_image names
+
+    File copies are I/O bound, so threads are plenty. The database isn't touched here: the caller writes
+    all of the new names back with one bulk_update().
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda pair: copy_poster(*pair), pairs))
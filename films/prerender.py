@@ -0,0 +1,207 @@
+"""Static copies of the public catalog pages, for the web server to hand anonymous visitors straight from disk.
+
+`manage.py prerender` renders every movie and person page, All Movies, All People and Free Movies (each page of
+the paginated lists) through the normal middleware and views, as a visitor without a session would get them,
+and writes them under PRERENDER_ROOT:
+
+    /movie/12-laura/            -> movie/12-laura/index.html
+    /all_people/?page=2         -> all_people/page-2.html
+
+manifest.json there records the stamp each page was written from: the movie's or person's updated_at, or the
+count and newest updated_at of a list (the same values as the ETags in conditional.py). A page is rewritten
+only when its stamp moved, its file is missing, or the templates changed since the last run (build_stamp());
+pages of movies and people that are gone, and list pages past the new last page, are deleted. The stamps are
+read before anything is rendered, so a change that lands mid-run is picked up by the next run.
+
+Files go under the decoded path (a unicode slug is written as itself, not %-escaped), which is what nginx's $uri
+holds. The web server should only use them for requests without a sessionid or messages cookie (the same rule as
+middleware.py), and fall through to Django for everything else, e.g. with nginx:
+
+    set $prerendered /prerendered;
+    if ($http_cookie ~* "(^|;\s*)(sessionid|messages)=") {
+        set $prerendered /no-such-dir;      # logged in (or a message waiting): always ask Django
+    }
+    try_files $prerendered$uri/page-$arg_page.html $prerendered${uri}index.html @django;
+"""
+
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.handlers.base import BaseHandler
+from django.db import connections
+from django.template.utils import get_app_template_dirs
+from django.test import RequestFactory
+from django.urls import reverse
+
+from .conditional import latest_change, stamp
+from .models import Movie, Person
+from .views import FreeMoviesList, PersonList
+
+MANIFEST = 'manifest.json'
+
+
+def list_pages(url_name, queryset, per_page):
+    """url -> stamp for every page of a paginated list; they all change together"""
+    count, updated_at = latest_change(queryset)
+    version = stamp(count, updated_at.timestamp() if updated_at else 0)
+    url = reverse(url_name)
+
+    pages = {url: version}
+    for page in range(2, math.ceil(count / per_page) + 1):
+        pages['{}?page={}'.format(url, page)] = version
+    return pages
+
+
+def catalog_pages():
+    """url -> stamp of every page to prerender"""
+    pages = {}
+    for model, url_name in [(Movie, 'films:movie'), (Person, 'films:person')]:
+        for pk, slug, updated_at in model.objects.values_list('id', 'slug', 'updated_at'):
+            url = reverse(url_name, kwargs={'pk': pk, 'slug': slug})
+            pages[url] = stamp(model._meta.model_name, pk, updated_at.timestamp())
+
+    pages.update(list_pages('films:all_movies', Movie.objects.all(), math.inf))
+    pages.update(list_pages('films:all_people', Person.objects.all(), PersonList.paginate_by))
+    pages.update(list_pages('films:free_movies', Movie.objects.filter(has_free_link=True),
+                            FreeMoviesList.paginate_by))
+    return pages
+
+
+def build_stamp():
+    """A hash of the templates and the settings that go into every page; when it changes, everything is rewritten"""
+    template_dirs = [str(path) for path in get_app_template_dirs('templates')]
+    for engine in settings.TEMPLATES:
+        template_dirs += [str(path) for path in engine.get('DIRS', [])]
+
+    digest = hashlib.md5()
+    for template_dir in sorted(set(template_dirs)):
+        for dirpath, dirnames, filenames in os.walk(template_dir):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                digest.update(path.encode())
+                with open(path, 'rb') as fob:
+                    digest.update(fob.read())
+    digest.update('{} {}'.format(settings.STATIC_URL, settings.MEDIA_URL).encode())
+    return digest.hexdigest()
+
+
+def output_file(root, url):
+    path, _, query = url.partition('?')
+    name = 'page-{}.html'.format(query.split('=', 1)[1]) if query else 'index.html'
+    return os.path.join(root, unquote(path).strip('/'), name)
+
+
+def default_host():
+    """The Host header to render with: the first plain ALLOWED_HOSTS entry"""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    return 'localhost'
+
+
+handler = None      # one per worker process, with the middleware loaded
+
+
+def render_page(url, path, host):
+    """Render url as an anonymous visitor and write it to path; returns None, or why the page couldn't be written"""
+    global handler
+    if handler is None:
+        handler = BaseHandler()
+        handler.load_middleware()
+
+    secure = getattr(settings, 'SECURE_SSL_REDIRECT', False)
+    response = handler.get_response(RequestFactory().get(url, HTTP_HOST=host, secure=secure))
+    if response.status_code != 200:
+        return 'status {}'.format(response.status_code)
+    if response.cookies:
+        # a page that sets a cookie can't be the same file for everyone
+        return 'sets cookies: {}'.format(', '.join(response.cookies))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as fob:
+        fob.write(response.content)
+    os.replace(path + '.tmp', path)     # the web server never sees half a file
+    return None
+
+
+def remove_page(root, url):
+    path = output_file(root, url)
+    if os.path.exists(path):
+        os.remove(path)
+    try:
+        os.rmdir(os.path.dirname(path))     # a movie's own directory; fails (fine) while anything is left in it
+    except OSError:
+        pass
+
+
+def read_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST)) as fob:
+            return json.load(fob)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(root, manifest):
+    path = os.path.join(root, MANIFEST)
+    with open(path + '.tmp', 'w') as fob:
+        json.dump(manifest, fob, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def render_many(root, urls, host, workers=4):
+    """Render urls in a pool of processes (rendering is mostly Python, so threads wouldn't help); yields (url, error)"""
+    if workers <= 1:
+        for url in urls:
+            yield url, render_page(url, output_file(root, url), host)
+        return
+
+    # forked workers inherit the set up Django; close the connections first so none of them is shared
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [(url, pool.submit(render_page, url, output_file(root, url), host)) for url in urls]
+        for url, future in futures:
+            try:
+                yield url, future.result()
+            except Exception as e:      # anything the handler didn't turn into a 500 (e.g. a write error)
+                yield url, repr(e)
+
+
+def prerender(root, workers=4, host=None, everything=False):
+    """Bring root up to date with the catalog; returns (written, unchanged, removed, [(url, error)])"""
+    os.makedirs(root, exist_ok=True)
+    build = build_stamp()
+    manifest = read_manifest(root)
+    written_stamps = manifest.get('pages', {}) if manifest.get('build') == build and not everything else {}
+
+    pages = catalog_pages()
+    stale = [
+        url for url, version in pages.items()
+        if written_stamps.get(url) != version or not os.path.exists(output_file(root, url))
+    ]
+
+    removed = 0
+    for url in set(manifest.get('pages', {})) - set(pages):
+        remove_page(root, url)
+        written_stamps.pop(url, None)
+        removed += 1
+
+    failed = []
+    for url, error in render_many(root, stale, host or default_host(), workers):
+        if error:
+            failed.append((url, error))
+            remove_page(root, url)              # Django serves it until the next run manages to write it
+            written_stamps.pop(url, None)
+        else:
+            written_stamps[url] = pages[url]
+
+    written_stamps = {url: written_stamps[url] for url in pages if url in written_stamps}
+    write_manifest(root, {'build': build, 'pages': written_stamps})
+    return len(stale) - len(failed), len(pages) - len(stale), removed, failed
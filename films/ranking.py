@@ -0,0 +1,106 @@
+"""Movie.rank, from a Bayesian-weighted average of each movie's reviews.
+
+A plain average puts a movie with a single 5-star review above a classic with forty 4.5s. Here every movie's
+average is pulled towards the site-wide mean rating, as though it had PRIOR_WEIGHT extra reviews at that mean:
+
+    score = (v * R + m * C) / (v + m)     R = movie's avg_rating, v = its num_reviews,
+                                          C = mean of all reviews,  m = PRIOR_WEIGHT
+
+so the more reviews a movie has, the more its own average counts. Ties (every unreviewed movie scores exactly C)
+are broken by review count and then by title, which makes the ranks a fixed order 1..N.
+
+rerank_all() recomputes every score and writes the ranks that changed with one bulk_update(); the rank_movies
+command runs it (from cron). When a review is written or deleted, rescore_movie() only updates that movie's own
+score, using the mean as it stands. Moving it to its new rank would shift every movie in between, a range
+UPDATE that two concurrent reviews could lock in opposite orders, so the ranks wait for the next full pass.
+top_movies() orders by score rather than rank, so the home page follows reviews straight away. The mean comes
+from the site-wide review count and rating total that review_stats.py keeps, so a review write doesn't have to
+read every other review.
+"""
+
+from django.db import transaction
+from django.db.models import Avg, F
+
+from .cache import RANKING, INDEX_PAGE, cached, purge
+from .models import Movie, Review, SiteCounter
+
+PRIOR_WEIGHT = 5
+
+TOP_MOVIES_CACHED = 10      # top_movies(n) is served from one cached list of this many
+
+
+def mean_rating():
+    """C in the formula above: the average of every review on the site (3, the middle, if there are none)"""
+    totals = dict(SiteCounter.objects.filter(
+        name__in=[SiteCounter.REVIEWS, SiteCounter.RATING_TOTAL]).values_list('name', 'value'))
+    if len(totals) == 2:
+        num_reviews, rating_total = totals[SiteCounter.REVIEWS], totals[SiteCounter.RATING_TOTAL]
+        return rating_total / num_reviews if num_reviews else 3.0
+
+    # the counters are missing (see review_stats.recount_site_totals), so count the slow way
+    mean = Review.objects.aggregate(mean=Avg('star_rating'))['mean']
+    return mean if mean is not None else 3.0
+
+
+def bayesian_score(avg_rating, num_reviews, mean, prior_weight=PRIOR_WEIGHT):
+    num_reviews = num_reviews or 0
+    if not num_reviews or avg_rating is None:
+        return mean
+    return (num_reviews * avg_rating + prior_weight * mean) / (num_reviews + prior_weight)
+
+
+def sort_key(score, num_reviews, name):
+    return (-score, -(num_reviews or 0), name)
+
+
+def rerank_all(batch_size=500):
+    """Score and rank every movie; returns the number of rows whose score or rank changed"""
+    mean = mean_rating()
+
+    rows = []
+    for movie_id, name, avg_rating, num_reviews, score, rank in Movie.objects.values_list(
+            'id', 'name', 'avg_rating', 'num_reviews', 'score', 'rank'):
+        new_score = bayesian_score(avg_rating, num_reviews, mean)
+        rows.append((sort_key(new_score, num_reviews, name), movie_id, new_score, score, rank))
+    rows.sort()
+
+    changed = []
+    for new_rank, (key, movie_id, new_score, old_score, old_rank) in enumerate(rows, start=1):
+        if new_rank != old_rank or new_score != old_score:
+            changed.append(Movie(id=movie_id, score=new_score, rank=new_rank))
+
+    with transaction.atomic():
+        Movie.objects.bulk_update(changed, ['score', 'rank'], batch_size=batch_size)
+
+    invalidate_top_movies()
+    return len(changed)
+
+
+def rescore_movie(movie):
+    """Bring one movie's score up to date after its reviews changed; its rank waits for the next rerank_all()"""
+    score = bayesian_score(movie.avg_rating, movie.num_reviews, mean_rating())
+    Movie.objects.filter(id=movie.id).update(score=score)
+    movie.score = score
+
+    top = top_movies(TOP_MOVIES_CACHED)
+    if len(top) < TOP_MOVIES_CACHED or movie.id in {m.id for m in top} or score >= top[-1].score:
+        invalidate_top_movies()
+    return score
+
+
+def top_movies(n=5):
+    """The n best scored movies: one query on the score index, then cached until a score near the top changes"""
+    def build():
+        best = Movie.objects.filter(score__isnull=False).order_by('-score', '-num_reviews', 'name')
+        movies = list(best[:TOP_MOVIES_CACHED])
+        if not movies and Movie.objects.exists():
+            # nothing has been scored yet (fresh database, rank_movies never run)
+            rerank_all()
+            movies = list(best[:TOP_MOVIES_CACHED])
+        return movies
+
+    return cached('top_movies', [RANKING], build)[:n]
+
+
+def invalidate_top_movies():
+    purge(RANKING, INDEX_PAGE)
@@ -0,0 +1,119 @@
+"""Per-movie review aggregates, kept as running totals.
+
+Movie carries num_reviews, rating_total and a stars_1..stars_5 histogram. Writing, re-rating or deleting a review
+adjusts them with one F() UPDATE in the review's own transaction, and a second UPDATE derives avg_rating from the
+new totals, so the cost doesn't depend on how many reviews a movie already has, and two reviews saved at once
+can't overwrite each other's numbers the way the old read-count-average-save did. The site-wide review count and
+rating total (two SiteCounter rows) move the same way, so ranking.py gets the mean rating without an AVG over
+every review. The movie's score is updated once the review commits, in its own single-row UPDATE, so the review's
+transaction only ever holds its own movie's row and the two counters.
+
+recompute_review_stats() recounts from the Review table, for the backfill and the verify_review_stats command.
+"""
+
+import math
+
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q, Sum
+from django.db.models.functions import Round
+
+from .cache import MOVIE_REVIEWS, bump_on_commit
+from .conditional import touch
+from .models import Movie, Review, SiteCounter
+from .ranking import rescore_movie
+
+STAR_FIELDS = {stars: 'stars_{}'.format(stars) for stars in range(1, 6)}
+AGGREGATE_FIELDS = ['num_reviews', 'rating_total', 'avg_rating'] + list(STAR_FIELDS.values())
+
+
+def average(rating_total, num_reviews):
+    """To 1 place, rounding halves up like the SQL Round() in apply_review_change (python's round() goes to even)"""
+    return math.floor(rating_total * 10 / num_reviews + 0.5) / 10 if num_reviews else None
+
+
+def apply_review_change(movie_id, added=None, removed=None):
+    """Adjust one movie's aggregates for a review added (added=stars), deleted (removed=stars) or re-rated (both)"""
+    changes = {'num_reviews': 0, 'rating_total': 0}
+    if added is not None:
+        changes['num_reviews'] += 1
+        changes['rating_total'] += added
+        changes[STAR_FIELDS[added]] = changes.get(STAR_FIELDS[added], 0) + 1
+    if removed is not None:
+        changes['num_reviews'] -= 1
+        changes['rating_total'] -= removed
+        changes[STAR_FIELDS[removed]] = changes.get(STAR_FIELDS[removed], 0) - 1
+
+    movie = Movie.objects.filter(id=movie_id)
+    with transaction.atomic():
+        movie.update(**{field: F(field) + change for field, change in changes.items() if change})
+
+        # the row is locked by the update above until we commit, so this reads our own totals
+        movie.filter(num_reviews__gt=0).update(avg_rating=Round(ExpressionWrapper(
+            F('rating_total') * 10.0 / F('num_reviews'), output_field=FloatField())) / 10.0)
+        movie.filter(num_reviews=0).update(avg_rating=None)
+        apply_site_totals(changes['num_reviews'], changes['rating_total'])
+
+    transaction.on_commit(lambda: rescore(movie_id))
+
+
+def rescore(movie_id):
+    movie = Movie.objects.only('id', 'name', 'num_reviews', 'avg_rating').filter(id=movie_id).first()
+    if movie is not None:
+        rescore_movie(movie)
+
+
+def apply_site_totals(num_reviews, rating_total):
+    """Move the site-wide counters by these amounts, recounting them if they're missing"""
+    for name, change in [(SiteCounter.REVIEWS, num_reviews), (SiteCounter.RATING_TOTAL, rating_total)]:
+        if change and not SiteCounter.objects.filter(name=name).update(value=F('value') + change):
+            recount_site_totals()
+            return
+
+
+def recount_site_totals():
+    totals = Review.objects.aggregate(num_reviews=Count('id'), rating_total=Sum('star_rating'))
+    SiteCounter.objects.update_or_create(name=SiteCounter.REVIEWS, defaults={'value': totals['num_reviews']})
+    SiteCounter.objects.update_or_create(name=SiteCounter.RATING_TOTAL,
+                                         defaults={'value': totals['rating_total'] or 0})
+
+
+def counted_stats(movies):
+    """{movie_id: {field: value}} for these movies, counted from the Review table in one grouped query"""
+    stats = {movie_id: dict.fromkeys(AGGREGATE_FIELDS, 0) for movie_id in movies.values_list('id', flat=True)}
+    for movie_id in stats:
+        stats[movie_id]['avg_rating'] = None
+
+    counts = Review.objects.filter(movie__in=movies).values('movie_id').annotate(
+        num_reviews=Count('id'),
+        rating_total=Sum('star_rating'),
+        **{field: Count('id', filter=Q(star_rating=stars)) for stars, field in STAR_FIELDS.items()}
+    )
+    for row in counts:
+        movie_id = row.pop('movie_id')
+        row['avg_rating'] = average(row['rating_total'], row['num_reviews'])
+        stats[movie_id].update(row)
+    return stats
+
+
+def recompute_review_stats(movies=None, fix=True, batch_size=500):
+    """Compare the stored aggregates with a recount, writing the ones that differ (with fix); returns the stale ids"""
+    movies = movies if movies is not None else Movie.objects.all()
+    stats = counted_stats(movies)
+
+    stale = []
+    for movie in movies.only('id', *AGGREGATE_FIELDS):
+        expected = stats[movie.id]
+        if any(getattr(movie, field) != value for field, value in expected.items()):
+            for field, value in expected.items():
+                setattr(movie, field, value)
+            stale.append(movie)
+
+    if fix:
+        recount_site_totals()
+    if fix and stale:
+        with transaction.atomic():
+            Movie.objects.bulk_update(stale, AGGREGATE_FIELDS, batch_size=batch_size)
+            for movie in stale:
+                bump_on_commit(MOVIE_REVIEWS, movie.id)
+            touch(Movie, [movie.id for movie in stale])
+    return [movie.id for movie in stale]
@@ -0,0 +1,378 @@
+"""In-memory title and name search, used by the search results page and the autocomplete box.
+
+Searching with name__icontains is a LIKE '%q%' scan over every Movie and Person row, no index can help it, and
+the autocomplete box runs one on every keystroke. Instead each worker process keeps a SearchIndex: every movie
+name, movie display name and person name is folded with normalize_text() and broken into trigrams, and each
+trigram points at the names that contain it. A lookup intersects the postings of the query's trigrams to find
+substring matches, and counts shared trigrams to find near misses, so 'Michele Morgan', 'michèle morgan' and
+'michelle morgan' all find her.
+
+Hits are ranked exact > prefix > infix > fuzzy, then by name. Saving or deleting a Movie or Person patches this
+process's index (signals.py) and bumps a version number in the cache (one of cache.py's clock-seeded versions),
+and other processes rebuild their copy the next time they see the version has moved. Both happen once the
+transaction commits, so no process can rebuild from the old rows and take the new version for them. The bulk
+loaders call invalidate_search_index() themselves.
+
+The autocomplete box wants something different: a few suggestions, fast, for every keystroke. For that the index
+also keeps its names in sorted lists, so complete() can bisect straight to the names (or words within names)
+starting with the term and stop after AUTOCOMPLETE_LIMIT. Entries carry their relative URL, worked out once when
+they're indexed. The suggestions for a term are cached under an ETag made from the term and the index version, so
+a repeat is a cache read, or a 304 if the browser already has them.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict, namedtuple
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+
+from .cache import MOVIE, PERSON, bump, get_versions
+from .models import Movie, Person
+from .text import normalize_text
+
+SEARCH_INDEX = ('search', 0)    # the version every process's index is checked against
+
+# match tiers, best first
+EXACT = 0
+PREFIX = 1
+INFIX = 2
+FUZZY = 3
+
+# share of trigrams a name must have in common with the query (Jaccard) to count as a fuzzy match
+FUZZY_CUTOFF = 0.45
+
+# suggestions are cached per version, so old ones just age out
+SUGGESTIONS_TIMEOUT = 60 * 60
+
+
+class Entry(namedtuple('Entry', ['kind', 'pk', 'slug', 'label', 'url'])):
+    """One movie or person in the index; label is what pages show for it"""
+
+    __slots__ = ()
+
+    @property
+    def key(self):
+        return (self.kind, self.pk)
+
+    def get_absolute_url(self):
+        return self.url
+
+
+class Hit(namedtuple('Hit', ['entry', 'tier', 'similarity'])):
+    __slots__ = ()
+
+    @property
+    def sort_key(self):
+        """Where the hit sits in a result list; unique, so it works as a pagination cursor"""
+        return (self.tier, -self.similarity, self.entry.label.casefold(), self.entry.kind, self.entry.pk)
+
+
+def trigrams(text):
+    """Trigrams of a folded name, padded so the start and end of the name are trigrams of their own"""
+    padded = ' {} '.format(text)
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_starts(term):
+    """Where each word after the first begins: 'the big heat' -> [4, 8]"""
+    return [i + 1 for i, c in enumerate(term) if c == ' ']
+
+
+def movie_entry(movie_id, slug, name, display_name):
+    url = reverse('films:movie', kwargs={'pk': movie_id, 'slug': slug})
+    return Entry(MOVIE, movie_id, slug, display_name or name, url), {name, display_name}
+
+
+def person_entry(person_id, slug, name):
+    url = reverse('films:person', kwargs={'pk': person_id, 'slug': slug})
+    return Entry(PERSON, person_id, slug, name, url), {name}
+
+
+class SearchIndex():
+    """Trigram postings over every searchable name, patched in place as rows change"""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.entries = {}                   # (kind, pk) -> Entry
+        self.entry_terms = {}               # (kind, pk) -> folded names it's indexed under
+        self.terms = defaultdict(set)       # folded name -> {(kind, pk)}
+        self.term_grams = {}                # folded name -> its trigram count
+        self.postings = defaultdict(set)    # trigram -> {folded name}
+        self.names = []                     # sorted folded names, for prefix lookups
+        self.words = []                     # sorted (rest of name from a later word, folded name)
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, version=None):
+        index = cls(version)
+        for row in Movie.objects.values_list('id', 'slug', 'name', 'display_name').iterator():
+            index.add(*movie_entry(*row), sort=False)
+        for row in Person.objects.values_list('id', 'slug', 'name').iterator():
+            index.add(*person_entry(*row), sort=False)
+        # one sort at the end rather than an insort per name
+        index.names.sort()
+        index.words.sort()
+        return index
+
+    def add(self, entry, names, sort=True):
+        self.entries[entry.key] = entry
+        terms = {normalize_text(name) for name in names if name} - {''}
+        self.entry_terms[entry.key] = terms
+
+        for term in terms:
+            if term not in self.terms:
+                grams = trigrams(term)
+                self.term_grams[term] = len(grams)
+                for gram in grams:
+                    self.postings[gram].add(term)
+
+                words = [(term[start:], term) for start in word_starts(term)]
+                if sort:
+                    insort(self.names, term)
+                    for word in words:
+                        insort(self.words, word)
+                else:
+                    self.names.append(term)
+                    self.words.extend(words)
+            self.terms[term].add(entry.key)
+
+    def remove(self, key):
+        self.entries.pop(key, None)
+        for term in self.entry_terms.pop(key, ()):
+            owners = self.terms[term]
+            owners.discard(key)
+            if owners:
+                continue
+            # nobody else is called this, so the name itself goes
+            del self.terms[term]
+            del self.term_grams[term]
+            for gram in trigrams(term):
+                self.postings[gram].discard(term)
+                if not self.postings[gram]:
+                    del self.postings[gram]
+            del self.names[bisect_left(self.names, term)]
+            for start in word_starts(term):
+                del self.words[bisect_left(self.words, (term[start:], term))]
+
+    def replace(self, entry, names):
+        with self.lock:
+            self.remove(entry.key)
+            self.add(entry, names)
+
+    def discard(self, key):
+        with self.lock:
+            self.remove(key)
+
+    def substring_terms(self, query):
+        """Folded names containing the query"""
+        if len(query) < 3:
+            # too short to have a trigram of its own, so check every name; still only a dict walk
+            return [term for term in self.terms if query in term]
+
+        grams = sorted((self.postings.get(query[i:i + 3], set()) for i in range(len(query) - 2)), key=len)
+        candidates = set.intersection(*grams) if grams else set()
+        # every trigram matching doesn't mean they're in the right order, so confirm
+        return [term for term in candidates if query in term]
+
+    def fuzzy_terms(self, query):
+        """{folded name: similarity} for names sharing enough trigrams with the query"""
+        query_grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for term in self.postings.get(gram, ()):
+                shared[term] += 1
+
+        similar = {}
+        for term, count in shared.items():
+            similarity = count / (len(query_grams) + self.term_grams[term] - count)
+            if similarity >= FUZZY_CUTOFF:
+                similar[term] = similarity
+        return similar
+
+    def search(self, query, limit=None, fuzzy=True):
+        """Ranked Hits for a query, best first"""
+        query = normalize_text(query or '')
+        if not query:
+            return []
+
+        best = {}
+
+        def offer(term, tier, similarity):
+            for key in self.terms[term]:
+                hit = best.get(key)
+                if hit is None or (tier, -similarity) < (hit.tier, -hit.similarity):
+                    best[key] = Hit(self.entries[key], tier, similarity)
+
+        with self.lock:
+            for term in self.substring_terms(query):
+                if term == query:
+                    offer(term, EXACT, 1.0)
+                elif term.startswith(query):
+                    offer(term, PREFIX, 1.0)
+                else:
+                    offer(term, INFIX, 1.0)
+
+            # a one- or two-letter query shares a trigram with half the catalog, so near misses mean nothing there
+            if fuzzy and len(query) >= 3:
+                for term, similarity in self.fuzzy_terms(query).items():
+                    offer(term, FUZZY, similarity)
+
+        hits = sorted(best.values(), key=attrgetter('sort_key'))
+        return hits[:limit] if limit is not None else hits
+
+    def complete(self, query, limit):
+        """Up to `limit` Entries for the autocomplete box: names starting with the query, then names with a word
+        starting with it, then (if that's still not enough) the infix and fuzzy matches from search()
+        """
+        query = normalize_text(query or '')
+        if not query:
+            return []
+
+        found = []
+        seen = set()
+
+        def take(term):
+            for key in sorted(self.terms[term]):
+                if key not in seen and len(found) < limit:
+                    seen.add(key)
+                    found.append(self.entries[key])
+
+        with self.lock:
+            # both lists are sorted, so the matches are one contiguous run from the bisect point
+            i = bisect_left(self.names, query)
+            while len(found) < limit and i < len(self.names) and self.names[i].startswith(query):
+                take(self.names[i])
+                i += 1
+
+            i = bisect_left(self.words, (query,))
+            while len(found) < limit and i < len(self.words) and self.words[i][0].startswith(query):
+                take(self.words[i][1])
+                i += 1
+
+            if len(found) < limit and len(query) >= 3:
+                for hit in self.search(query):
+                    if hit.entry.key not in seen and len(found) < limit:
+                        seen.add(hit.entry.key)
+                        found.append(hit.entry)
+
+        return found
+
+
+# one per worker process
+_index = None
+_index_lock = threading.Lock()
+
+
+def current_version():
+    return get_versions([SEARCH_INDEX])[0]
+
+
+def get_search_index():
+    """This process's index, rebuilt first if another process (or a bulk load) has changed the catalog"""
+    global _index
+    version = current_version()
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = SearchIndex.build(version)
+        return _index
+
+
+def search(query, limit=None, fuzzy=True):
+    return get_search_index().search(query, limit=limit, fuzzy=fuzzy)
+
+
+def encode_cursor(hit):
+    return base64.urlsafe_b64encode(json.dumps(hit.sort_key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The sort key a cursor points at, or None if it's missing or garbled"""
+    try:
+        tier, similarity, label, kind, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (int(tier), float(similarity), str(label), str(kind), int(pk))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def page_of_hits(hits, per_page, after=None, before=None):
+    """(start, page) for the `per_page` hits just after the `after` cursor, or just before `before`
+
+    A cursor names the last (or first) hit shown rather than a page number, so a catalog change between two
+    requests can't make the next page skip or repeat rows the way an offset would.
+    """
+    keys = [hit.sort_key for hit in hits]
+    after, before = decode_cursor(after), decode_cursor(before)
+
+    if after is not None:
+        start = bisect_right(keys, after)
+    elif before is not None:
+        start = max(0, bisect_left(keys, before) - per_page)
+        end = bisect_left(keys, before)
+        return start, hits[start:end]
+    else:
+        start = 0
+    return start, hits[start:start + per_page]
+
+
+def autocomplete_limit():
+    return getattr(settings, 'AUTOCOMPLETE_LIMIT', 10)
+
+
+def suggestions_etag(term):
+    """Changes whenever the term (once folded), the limit or the catalog does"""
+    key = '{}:{}:{}'.format(current_version(), autocomplete_limit(), normalize_text(term or ''))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def get_suggestions(term):
+    """[{'label', 'url'}] for the autocomplete box, cached per folded term and index version"""
+    cache_key = 'films:suggestions:{}'.format(suggestions_etag(term))
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        suggestions = [{'label': entry.label, 'url': entry.url}
+                       for entry in get_search_index().complete(term, autocomplete_limit())]
+        cache.set(cache_key, suggestions, SUGGESTIONS_TIMEOUT)
+    return suggestions
+
+
+def patch_index(change):
+    """Once the transaction commits, apply one change to this process's index if it has one, and move the version on"""
+    def apply():
+        old = current_version()
+        new = bump(*SEARCH_INDEX)
+        with _index_lock:
+            if _index is None:
+                return
+            if _index.version == old:
+                change(_index)
+                _index.version = new
+            # otherwise someone else changed the catalog too, and we've not seen it; get_search_index() rebuilds
+
+    transaction.on_commit(apply)
+
+
+def index_movie(movie):
+    patch_index(lambda index: index.replace(*movie_entry(movie.id, movie.slug, movie.name, movie.display_name)))
+
+
+def index_person(person):
+    patch_index(lambda index: index.replace(*person_entry(person.id, person.slug, person.name)))
+
+
+def unindex(kind, pk):
+    patch_index(lambda index: index.discard((kind, pk)))
+
+
+def invalidate_search_index():
+    """After bulk writes, which don't send the signals that keep the index patched"""
+    transaction.on_commit(lambda: bump(*SEARCH_INDEX))
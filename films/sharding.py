@@ -0,0 +1,131 @@
+"""Multi-process movie loading, for catalogs far bigger than fin_movie_list.json.
+
+People are loaded first, in this process, so every worker starts with the complete name -> id map. The movie
+source is then cut into shards of `shard_size` records, and each shard is written by a worker process through the
+ordinary CatalogLoader.load_movies(): its own database connection, one transaction per batch. Workers keep their
+failures in an in-memory journal and hand them back with their counters, and the parent merges them into the
+real journal, so a sharded run reads the same in `manage.py ingest_journal` as a single-process one.
+
+SQLite only allows one writer at a time, so there the loader falls back to loading in-process.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import django
+from django.apps import apps
+from django.db import connection, connections
+
+from .journal import IngestJournal
+from .loader import CatalogLoader, NameMap, batched
+
+SHARD_SIZE = 2000
+
+# set up once per worker process by init_worker()
+_worker_state = {}
+
+
+def usable_workers(workers):
+    """How many writer processes the database can actually use"""
+    if connection.vendor == 'sqlite':
+        return 1
+    return max(1, workers)
+
+
+def init_worker(batch_size, run_id, job_map, person_pairs):
+    # with the 'spawn' start method (macOS, Windows) the worker is a fresh interpreter
+    if not apps.ready:
+        django.setup()
+
+    _worker_state.update(
+        batch_size=batch_size,
+        run_id=run_id,
+        job_map=job_map,
+        person_map=NameMap(person_pairs),
+    )
+
+
+def load_shard(movie_dicts):
+    """Runs in a worker: load one shard of movies, return its counters and failures"""
+    loader = CatalogLoader(
+        batch_size=_worker_state['batch_size'],
+        journal=IngestJournal(filename=None, run_id=_worker_state['run_id']),
+    )
+    loader.job_map = _worker_state['job_map']
+    loader.person_map = _worker_state['person_map']
+
+    loader.load_movies(movie_dicts)
+
+    return {
+        'counts': dict(loader.counts),
+        'skipped': dict(loader.skipped),
+        'changed_ids': dict(loader.changed_ids),
+        'fails': loader.journal.buffer,
+    }
+
+
+class ShardedLoader(CatalogLoader):
+    """CatalogLoader whose load_movies() fans the shards out over a process pool"""
+
+    def __init__(self, batch_size=500, journal=None, workers=4, shard_size=SHARD_SIZE):
+        super().__init__(batch_size=batch_size, journal=journal)
+        self.workers = workers
+        self.shard_size = shard_size
+
+    def load_movies(self, movies, checkpoint=None):
+        """Shards finish out of order, so there's no single offset to checkpoint; only the fallback uses one"""
+        if usable_workers(self.workers) == 1:
+            return super().load_movies(movies, checkpoint)
+
+        started = time.perf_counter()
+        if not self.job_map:
+            self.load_jobs()
+        if not len(self.person_map):
+            self.load_person_map()
+
+        # forked workers would otherwise share this process's connection socket
+        connections.close_all()
+
+        initargs = (self.batch_size, self.journal.run_id, self.job_map, list(self.person_map.exact.items()))
+        with self.journal.stage('load_movies'), \
+                ProcessPoolExecutor(self.workers, initializer=init_worker, initargs=initargs) as pool:
+            pending = set()
+            for shard in self.shards(movies):
+                self.journal.count('load_movies', len(shard))
+                pending.add(pool.submit(load_shard, shard))
+
+                # only keep a couple of shards per worker in flight, so memory stays flat
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self.merge_results(done)
+
+            self.merge_results(pending)
+
+        self.elapsed += time.perf_counter() - started
+
+    def shards(self, movies):
+        """Cut the source into shards, dropping repeated titles
+
+        In a single process a repeated title is skipped because the first copy is already in the db; two workers
+        could both insert it, so repeats are skipped here instead.
+        """
+        seen = set()
+        for batch in batched(movies, self.shard_size):
+            shard = []
+            for movie_dict in batch:
+                if movie_dict['title'] in seen:
+                    self.skipped['Movie'] += 1
+                    continue
+                seen.add(movie_dict['title'])
+                shard.append(movie_dict)
+            if shard:
+                yield shard
+
+    def merge_results(self, futures):
+        for future in futures:
+            result = future.result()
+            self.counts.update(result['counts'])
+            self.skipped.update(result['skipped'])
+            for model_name, ids in result['changed_ids'].items():
+                self.changed_ids[model_name].update(ids)
+            self.flog.merge(result['fails'])
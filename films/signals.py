@@ -0,0 +1,114 @@
+"""Keeps cached catalog data in step with the models; connected in FilmsConfig.ready()"""
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import MOVIE, PERSON, MOVIE_REVIEWS, FREE_LIST, INDEX_PAGE, bump_on_commit, purge
+from .catalog import invalidate_movie_index, refresh_free_flag
+from .conditional import touch
+from .daily import invalidate_daily_pick, invalidate_if_picked
+from .models import Person, Movie, Cast, Crew, MediaLink, Review
+from .review_stats import apply_review_change
+from .search import index_movie, index_person, unindex
+
+
+def credited_people(movie_id):
+    return set(Cast.objects.filter(movie_id=movie_id).values_list('person_id', flat=True)) | \
+        set(Crew.objects.filter(movie_id=movie_id).values_list('person_id', flat=True))
+
+
+def credited_movies(person_id):
+    return set(Cast.objects.filter(person_id=person_id).values_list('movie_id', flat=True)) | \
+        set(Crew.objects.filter(person_id=person_id).values_list('movie_id', flat=True))
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, **kwargs):
+    invalidate_movie_index()
+    invalidate_daily_pick()
+    # titles and posters on the home page and the free list
+    purge(INDEX_PAGE, FREE_LIST)
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, **kwargs):
+    index_movie(instance)
+    bump_on_commit(MOVIE, instance.id)
+    # the title shows up on the filmography of everyone in it
+    people = credited_people(instance.id)
+    for person_id in people:
+        bump_on_commit(PERSON, person_id)
+    touch(Person, people)
+
+
+@receiver(post_delete, sender=Movie)
+def movie_deleted(sender, instance, **kwargs):
+    # its Cast and Crew rows are deleted first, and their own receivers take care of the people
+    unindex(MOVIE, instance.id)
+    bump_on_commit(MOVIE, instance.id)
+
+
+@receiver(post_save, sender=Person)
+def person_saved(sender, instance, **kwargs):
+    index_person(instance)
+    bump_on_commit(PERSON, instance.id)
+    movies = credited_movies(instance.id)
+    for movie_id in movies:
+        bump_on_commit(MOVIE, movie_id)
+    touch(Movie, movies)
+
+
+@receiver(post_delete, sender=Person)
+def person_deleted(sender, instance, **kwargs):
+    unindex(PERSON, instance.id)
+    bump_on_commit(PERSON, instance.id)
+
+
+@receiver(post_save, sender=Cast)
+@receiver(post_delete, sender=Cast)
+@receiver(post_save, sender=Crew)
+@receiver(post_delete, sender=Crew)
+def credit_changed(sender, instance, **kwargs):
+    bump_on_commit(MOVIE, instance.movie_id)
+    bump_on_commit(PERSON, instance.person_id)
+    touch(Movie, [instance.movie_id])
+    touch(Person, [instance.person_id])
+
+
+@receiver(post_save, sender=MediaLink)
+@receiver(post_delete, sender=MediaLink)
+def media_link_changed(sender, instance, **kwargs):
+    refresh_free_flag(instance.movie_id)
+    invalidate_daily_pick()
+    bump_on_commit(MOVIE, instance.movie_id)
+    touch(Movie, [instance.movie_id])
+    purge(INDEX_PAGE, FREE_LIST)
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    # a post_delete receiver rather than a Review.delete() override, so cascades (e.g. a deleted user) count too
+    apply_review_change(instance.movie_id, removed=instance.star_rating)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    # only the reviews part of the movie page; the credits stay cached
+    bump_on_commit(MOVIE_REVIEWS, instance.movie_id)
+    touch(Movie, [instance.movie_id])
+    # the rating changes with an F() update and no Movie post_save, so movie_changed doesn't see it
+    invalidate_if_picked(instance.movie_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # reviews are signed with the username; logging in saves the user too, but only last_login
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    movies = list(Review.objects.filter(user=instance).values_list('movie_id', flat=True))
+    for movie_id in movies:
+        bump_on_commit(MOVIE_REVIEWS, movie_id)
+    touch(Movie, movies)
@@ -0,0 +1,104 @@
+"""Streaming readers for the catalog source files.
+
+iter_records() yields one movie / person dict at a time, so the loader's memory use depends on its batch size
+rather than on the size of the file. Two layouts are accepted, plain or gzip-compressed (detected from the
+file's magic bytes, not its name):
+
+    - a top-level json array, like fin_movie_list.json and fin_people_list.json
+    - newline-delimited json (one record per line)
+"""
+
+import gzip
+import json
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class SourceFormatError(ValueError):
+    pass
+
+
+def open_source(filename):
+    """Open a source file for reading text, transparently un-gzipping it"""
+    with open(filename, 'rb') as probe:
+        magic = probe.read(2)
+
+    if magic == GZIP_MAGIC:
+        return gzip.open(filename, 'rt', encoding='utf-8')
+    return open(filename, encoding='utf-8')
+
+
+def iter_records(filename, chunk_size=CHUNK_SIZE):
+    """Yield the records of a json array or NDJSON file, one dict at a time"""
+    with open_source(filename) as fob:
+        head = fob.read(chunk_size).lstrip('\ufeff \t\r\n')
+
+        if head.startswith('['):
+            yield from _iter_array(fob, head[1:], chunk_size)
+        else:
+            yield from _iter_lines(fob, head)
+
+
+def _iter_array(fob, buffer, chunk_size):
+    """Incrementally decode the elements of a top-level json array"""
+    eof = False
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+
+        # keep reading until there is something to decode (or nothing left to read)
+        while not buffer and not eof:
+            chunk = fob.read(chunk_size)
+            eof = not chunk
+            buffer = chunk.lstrip(' \t\r\n,')
+
+        if not buffer:
+            raise SourceFormatError('json array was not closed')
+        if buffer[0] == ']':
+            return
+
+        try:
+            record, end = _decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            record, end = None, None
+
+        # a value that runs right up to the end of the buffer may have been cut off mid-number or mid-literal,
+        # so it only counts once there's more text after it (or the file is exhausted)
+        if end is None or (end == len(buffer) and not eof):
+            if eof:
+                raise SourceFormatError('could not decode json near: {!r}'.format(buffer[:80]))
+            chunk = fob.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+
+        yield record
+        buffer = buffer[end:]
+
+
+def _iter_lines(fob, head):
+    """Decode newline-delimited json; `head` is text already read from the start of the file"""
+    line_number = 0
+
+    for line in _lines(fob, head):
+        line_number += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise SourceFormatError('line {}: {}'.format(line_number, e))
+
+
+def _lines(fob, head):
+    """Lines of the file, given that `head` was already consumed from it"""
+    rest_of_line = fob.readline()
+    lines = (head + rest_of_line).split('\n')
+    if lines[-1] == '':
+        lines.pop()     # the text ended on a newline, which split() turns into one more (empty) "line"
+    yield from lines
+    yield from fob
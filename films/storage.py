@@ -0,0 +1,62 @@
+"""Content-addressed file storage for posters and their variants.
+
+Files are named after the sha256 of their bytes (posters/3f/3fa2...e1.jpg), so:
+    - importing the same image twice stores it once, instead of Django's name_AbC123.jpg suffixed copies
+    - a given URL always means the same bytes, so these files can be served with far-future immutable caching
+Nothing is deleted when a poster is replaced, since another movie may share the file; unreferenced files are
+removed by the gc_posters command.
+"""
+
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK = 64 * 1024
+
+
+def content_hash(content):
+    """sha256 hex digest of a django File, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def is_hashed_name(name):
+    """True for names this storage produced, e.g. posters/3f/3fa2...e1.jpg"""
+    stem = os.path.splitext(posixpath.basename(name))[0]
+    parent = posixpath.basename(posixpath.dirname(name))
+    return len(stem) == 64 and parent == stem[:2] and all(c in '0123456789abcdef' for c in stem)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        # keep the upload_to directory and the (lowercased) extension, replace the filename with the digest
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        name = self.hashed_name(name, content)
+        if self.exists(name):
+            return name     # same name means same bytes, nothing to write
+        return super().save(name, content, max_length=max_length)
+
+
+poster_storage = ContentAddressedStorage()
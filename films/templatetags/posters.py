@@ -0,0 +1,56 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..models import PosterVariant
+
+register = template.Library()
+
+
+def variants_for(movie):
+    """Group a movie's variants by format, smallest first; uses prefetch_related('poster_variants') if present"""
+    grouped = {}
+    for variant in sorted(movie.poster_variants.all(), key=lambda v: v.width):
+        if variant.source_name != movie.poster_image.name:
+            continue    # made from an older poster; build_poster_variants will replace it
+        grouped.setdefault(variant.format, []).append(variant)
+    return grouped
+
+
+def srcset(variants):
+    # small originals aren't scaled up, so several sizes can share a width; list each width once
+    by_width = {}
+    for variant in variants:
+        by_width.setdefault(variant.width, variant)
+    return ', '.join('{} {}w'.format(variant.image.url, width) for width, variant in by_width.items())
+
+
+@register.simple_tag
+def poster_srcset(movie, image_format=PosterVariant.JPEG):
+    """Just the srcset string, for templates that build their own <img>"""
+    return srcset(variants_for(movie).get(image_format, []))
+
+
+@register.simple_tag
+def poster_picture(movie, size=PosterVariant.CARD, sizes='100vw', css_class='figure-img img-fluid'):
+    """A <picture> with WebP and JPEG srcsets; the browser picks the smallest file that fits `sizes`.
+
+    Falls back to a plain <img> of the original upload when a poster has no variants yet (or is an svg).
+    """
+    if not movie.poster_image:
+        return ''
+
+    grouped = variants_for(movie)
+    jpegs = grouped.get(PosterVariant.JPEG, [])
+    if not jpegs:
+        return format_html('<img src="{}" class="{}" alt="{}">', movie.poster_image.url, css_class, movie.name)
+
+    default = next((v for v in jpegs if v.size == size), jpegs[-1])
+    sources = format_html_join(
+        '', '<source type="image/webp" srcset="{}" sizes="{}">',
+        [(srcset(grouped[PosterVariant.WEBP]), sizes)] if grouped.get(PosterVariant.WEBP) else [],
+    )
+
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" class="{}" alt="{}"></picture>',
+        sources, default.image.url, srcset(jpegs), sizes, default.width, default.height, css_class, movie.name,
+    )
@@ -1,3 +1,287 @@
-from django.test import TestCase
+from io import StringIO
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as shared_cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from . import cache
+from .conditional import touch
+from .journal import IngestJournal
+from .loader import CatalogLoader
+from .models import Person, Movie, Cast, Job, Crew, Review, MediaLink
+from .ranking import bayesian_score, mean_rating
+from .review_stats import recompute_review_stats
+from .search import EXACT, PREFIX, INFIX, FUZZY, search
+
+
+class MovieDetailQueryTests(TestCase):
+    """The movie page should cost the same handful of queries however many people are credited"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.jobs = {title: Job.objects.create(job_title=title)
+                    for title in ['Director', 'Producer', 'Cinematographer', 'Writer', 'Composer']}
+        cls.user = get_user_model().objects.create_user('reviewer', password='pw')
+
+    def make_movie(self, name, cast_size):
+        movie = Movie.objects.create(name=name, display_name=name, year=1950, based_on='n/a')
+
+        for job_title in self.jobs:
+            person = Person.objects.create(name='{} {}'.format(job_title, name))
+            Crew.objects.create(person=person, movie=movie, job=self.jobs[job_title])
+
+        for i in range(cast_size):
+            person = Person.objects.create(name='Actor {} {}'.format(i, name))
+            Cast.objects.create(person=person, movie=movie, role='Role {}'.format(i), starring_role=i < 2)
+
+        MediaLink.objects.create(movie=movie, url_link='https://example.com/{}'.format(movie.id), free=True)
+        Review.objects.create(movie=movie, user=self.user, star_rating=4, review_text='Good.')
+        return movie
+
+    def count_queries(self, movie):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(movie.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_cast(self):
+        small = self.make_movie('Small Cast', 2)
+        large = self.make_movie('Large Cast', 20)
+
+        small_response, small_queries = self.count_queries(small)
+        large_response, large_queries = self.count_queries(large)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertLessEqual(large_queries, 8)
+
+        self.assertEqual(len(large_response.context['starring_list']), 2)
+        self.assertEqual(len(large_response.context['cast_list']), 18)
+        self.assertEqual(large_response.context['cast_list'][0][1], 'Role 10')   # sorted by person name
+
+    def test_logged_in_query_count_does_not_grow_with_cast(self):
+        small = self.make_movie('Small Cast', 2)
+        large = self.make_movie('Large Cast', 20)
+        self.client.force_login(self.user)
+
+        small_response, small_queries = self.count_queries(small)
+        large_response, large_queries = self.count_queries(large)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large_response.context['user_review'].review_text, 'Good.')
+
+    def test_crew_is_grouped_by_job(self):
+        movie = self.make_movie('Crewed', 1)
+        response, _ = self.count_queries(movie)
+
+        crew_dict = response.context['crew_dict']
+        self.assertEqual(crew_dict['director'].name, 'Director Crewed')
+        self.assertEqual(crew_dict['camera'].name, 'Cinematographer Crewed')
+        self.assertEqual([p.name for p in crew_dict['writers']], ['Writer Crewed'])
+
+
+class SearchTests(TestCase):
+    """The in-memory index should rank matches and follow Movie/Person saves and deletes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ['The Killers', 'The Killing', 'Killer\'s Kiss', 'Born to Kill']:
+            Movie.objects.create(name=name, display_name=name, year=1950, based_on='n/a')
+        Person.objects.create(name='Michèle Morgan')
+
+    def test_tiers(self):
+        hits = search('killers')
+        self.assertEqual([(hit.entry.label, hit.tier) for hit in hits], [('The Killers', INFIX)])
+
+        tiers = {hit.entry.label: hit.tier for hit in search('kill')}
+        self.assertEqual(tiers['Killer\'s Kiss'], PREFIX)
+        self.assertEqual(tiers['Born to Kill'], INFIX)
+        self.assertEqual(search('the killing')[0].tier, EXACT)
+
+    def test_folding_and_typos(self):
+        self.assertEqual(search('michele morgan')[0].tier, EXACT)
+        hits = search('michelle morgan')
+        self.assertEqual(hits[0].entry.label, 'Michèle Morgan')
+        self.assertEqual(hits[0].tier, FUZZY)
+
+
+class SearchIndexChangeTests(TransactionTestCase):
+    """The index is patched when a save commits, which a TestCase never does"""
+
+    def test_index_follows_changes(self):
+        person = Person.objects.create(name='Gloria Grahame')
+        self.assertEqual(search('grahame')[0].entry.pk, person.id)
+
+        person.name = 'Gloria Swanson'
+        person.save()
+        self.assertEqual(search('grahame'), [])
+
+        person.delete()
+        self.assertEqual(search('swanson'), [])
+
+
+class TagStarsTests(TestCase):
+    """tag_stars --reset clears everyone not listed, so it has to know exactly who is listed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        movie = Movie.objects.create(name='Laura', display_name='Laura', year=1944, based_on='n/a')
+        cls.tierney = Person.objects.create(name='Gene Tierney')
+        cls.andrews = Person.objects.create(name='Dana Andrews')
+        Cast.objects.create(person=cls.tierney, movie=movie, role='Laura Hunt')
+        Cast.objects.create(person=cls.andrews, movie=movie, role='Mark McPherson', starring_role=True)
+
+    def test_reset_refuses_partial_resolution(self):
+        with self.assertRaises(CommandError):
+            call_command('tag_stars', 'Gene Tierney', 'Dana Andrew', reset=True, stdout=StringIO())
+        self.assertTrue(Cast.objects.get(person=self.andrews).starring_role)
+        self.assertFalse(Cast.objects.get(person=self.tierney).starring_role)
+
+    def test_reset_with_every_name_resolved(self):
+        call_command('tag_stars', 'gene tierney', reset=True, stdout=StringIO())
+        self.assertTrue(Cast.objects.get(person=self.tierney).starring_role)
+        self.assertFalse(Cast.objects.get(person=self.andrews).starring_role)
+
+
+class LoaderTests(TestCase):
+    """A record repeated in the source is only inserted once, even within one batch"""
+
+    def setUp(self):
+        self.loader = CatalogLoader(journal=IngestJournal(filename=None))
+
+    def test_repeated_people(self):
+        people = [{'name': name, 'dob': '', 'dod': ''} for name in ['Gene Tierney', 'Dana Andrews', 'Gene Tierney']]
+        self.loader.load_people(people)
+        self.assertEqual(Person.objects.filter(name='Gene Tierney').count(), 1)
+        self.assertEqual(self.loader.counts['Person'], 2)
+        self.assertEqual(self.loader.skipped['Person'], 1)
+
+    def test_repeated_titles(self):
+        movie = {
+            'title': 'Laura (1944)', 'release date': 'October 11, 1944', 'studio': 'Fox', 'based on': 'n/a',
+            'cast': [], 'director': 'Otto Preminger', 'camera': 'Joseph LaShelle', 'composer': 'uncredited',
+            'producer': [], 'writers': [], 'media_links': [],
+        }
+        self.loader.load_movies([movie, dict(movie)])
+        self.assertEqual(Movie.objects.filter(name='Laura (1944)').count(), 1)
+        self.assertEqual(self.loader.skipped['Movie'], 1)
+
+
+class ReviewStatsTests(TransactionTestCase):
+    """Running review totals should always match a recount (the score is updated on commit, so no TestCase)"""
+
+    def setUp(self):
+        self.movie = Movie.objects.create(name='Laura', display_name='Laura', year=1944, based_on='n/a')
+        self.users = [get_user_model().objects.create_user('reviewer{}'.format(i), password='pw') for i in range(3)]
+
+    def assert_matches_recount(self, num_reviews, avg_rating):
+        self.assertEqual(recompute_review_stats(fix=False), [])
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.num_reviews, num_reviews)
+        self.assertEqual(self.movie.avg_rating, avg_rating)
+        self.assertEqual(self.movie.score, bayesian_score(avg_rating, num_reviews, mean_rating()))
+
+    def review(self, user, stars):
+        return Review.objects.create(movie=self.movie, user=user, star_rating=stars, review_text='.')
+
+    def test_create_edit_delete(self):
+        first = self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.assert_matches_recount(2, 3.5)
+
+        first.star_rating = 3
+        first.save()
+        self.assert_matches_recount(2, 2.5)
+        self.assertEqual((self.movie.stars_3, self.movie.stars_5), (1, 0))
+
+        first.delete()
+        self.assert_matches_recount(1, 2.0)
+
+    def test_rounds_half_up_like_the_recount(self):
+        for user, stars in zip(self.users, [4, 4, 5]):
+            self.review(user, stars)
+        self.assert_matches_recount(3, 4.3)
+
+    def test_moving_a_review_to_another_movie(self):
+        other = Movie.objects.create(name='Gilda', display_name='Gilda', year=1946, based_on='n/a')
+        review = self.review(self.users[0], 4)
+        review.movie = other
+        review.save()
+        self.assert_matches_recount(0, None)
+        other.refresh_from_db()
+        self.assertEqual((other.num_reviews, other.avg_rating), (1, 4.0))
+
+
+class PageCacheTests(TestCase):
+    """Anonymous pages come from the whole-page cache until something on them changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.movie = Movie.objects.create(name='Laura', display_name='Laura', year=1944, based_on='n/a')
+        cls.person = Person.objects.create(name='Gene Tierney')
+        cls.cast = Cast.objects.create(person=cls.person, movie=cls.movie, role='Laura Hunt')
+        cls.user = get_user_model().objects.create_user('reviewer', password='pw')
+
+    def setUp(self):
+        shared_cache.clear()
+        cache.local.clear()
+        self.url = self.movie.get_absolute_url()
+
+    def test_hit_costs_no_queries(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second.content, first.content)
+
+    def assert_purged_by(self, change, text):
+        self.assertNotContains(self.client.get(self.url), text)
+        change()
+        self.assertContains(self.client.get(self.url), text)
+
+    def test_purged_by_cast_change(self):
+        def change():
+            self.cast.role = 'Laura Hunt (the portrait)'
+            self.cast.save()
+        self.assert_purged_by(change, 'the portrait')
+
+    def test_purged_by_review(self):
+        self.assert_purged_by(
+            lambda: Review.objects.create(movie=self.movie, user=self.user, star_rating=5, review_text='Haunting.'),
+            'Haunting.')
+
+    def test_purged_by_media_link(self):
+        self.assert_purged_by(
+            lambda: MediaLink.objects.create(movie=self.movie, url_link='https://example.com/laura', free=True),
+            'https://example.com/laura')
+
+    def test_session_cookie_bypasses_cache(self):
+        self.client.get(self.url)
+        hits = cache.stats['page_hits']
+
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'not-a-real-session'
+        self.client.get(self.url)
+        self.assertEqual(cache.stats['page_hits'], hits)
+
+    def test_only_plain_page_numbers_are_cached(self):
+        for query in ['?utm_source=x', '?page=2&utm_source=x', '?page=02', '?page=2&page=3', '?page=x']:
+            self.client.get(self.url + query)
+            hits = cache.stats['page_hits']
+            self.client.get(self.url + query)
+            self.assertEqual(cache.stats['page_hits'], hits, query)
+
+        self.client.get(self.url + '?page=2')
+        hits = cache.stats['page_hits']
+        self.client.get(self.url + '?page=2')
+        self.assertEqual(cache.stats['page_hits'], hits + 1)
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        touch(Movie, [self.movie.id])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
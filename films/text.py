@@ -0,0 +1,15 @@
+"""Text folding shared by the poster matcher and the name lookups"""
+
+import re
+import unicodedata
+
+
+def fold_text(text):
+    """Casefold and strip accents, about what MySQL's default collation ignores: 'Michèle' -> 'michele'"""
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).casefold()
+
+
+def normalize_text(text):
+    """Casefold, strip accents and collapse punctuation/whitespace: 'Michèle  Morgan' -> 'michele morgan'"""
+    return re.sub(r'[\W_]+', ' ', fold_text(text)).strip()
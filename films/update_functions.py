@@ -1,77 +1,125 @@
+import difflib
+from collections import defaultdict
 
-from .models import Person, Movie, Cast, Job, Crew, Review, UserMovieLink, MediaLink
-
-def get_stars():
-    stars = [
-        'Humphrey Bogart',
-        'Dan Duryea',
-        'Glenn Ford',
-        'Rita Hayworth',
-        'Ida Lupino',
-        'Robert Ryan',
-        'Burt Lancaster',
-        'Gloria Graham',
-        'Barbara Stanwyck',
-        'Sterling Hayden',
-        'Edward G. Robinson',
-        'Lauren Bacall',
-        'Dana Andrews',
-        'Richard Conte',
-        'Orson Welles',
-        'William Holden',
-        'Joan Bennett',
-        'Fred MacMurray',
-        'Gloria Swanson',
-        'Jane Greer',
-        'Robert Mitchum',
-        'Veronica Lake',
-        'James Cagney',
-        'Alan Ladd',
-        'Brian Donlevy',
-        'Lizabeth Scott',
-        'Peter Lorre',
-        'Kirk Douglas',
-        'Mary Astor',
-        'Audrey Totter',
-        "Edmond O'Brien",
-        'Gene Tierney',
-        'Vincent Price',
-        'Ava Gardner',
-    ]
-
-
-    star_objects = []
-
-    for star in stars:
-        try:
-            s_object = Person.objects.get(name__icontains=star.lower())
-        except Person.DoesNotExist:
-            print('Could not retrieve a Person object for {}'.format(star))
+from django.db.models import Count
 
+from .models import Person, Movie, Cast, Job, Crew, Review, UserMovieLink, MediaLink
+from .text import normalize_text
+
+# default list of stars for manage.py tag_stars
+STARS = [
+    'Humphrey Bogart',
+    'Dan Duryea',
+    'Glenn Ford',
+    'Rita Hayworth',
+    'Ida Lupino',
+    'Robert Ryan',
+    'Burt Lancaster',
+    'Gloria Grahame',
+    'Barbara Stanwyck',
+    'Sterling Hayden',
+    'Edward G. Robinson',
+    'Lauren Bacall',
+    'Dana Andrews',
+    'Richard Conte',
+    'Orson Welles',
+    'William Holden',
+    'Joan Bennett',
+    'Fred MacMurray',
+    'Gloria Swanson',
+    'Jane Greer',
+    'Robert Mitchum',
+    'Veronica Lake',
+    'James Cagney',
+    'Alan Ladd',
+    'Brian Donlevy',
+    'Lizabeth Scott',
+    'Peter Lorre',
+    'Kirk Douglas',
+    'Mary Astor',
+    'Audrey Totter',
+    "Edmond O'Brien",
+    'Gene Tierney',
+    'Vincent Price',
+    'Ava Gardner',
+]
+
+
+def resolve_people(names):
+    """Match names to Person ids with one query over the people table.
+
+    An exact name match wins; otherwise names are compared after normalize_text() (case, accents, punctuation).
+    Returns (matched, ambiguous, unmatched): matched maps each requested name to a (id, name) pair, ambiguous
+    maps a name to every candidate pair, and unmatched maps a name to a few close spellings to suggest.
+    """
+    exact = defaultdict(list)
+    folded = defaultdict(list)
+    for pk, name in Person.objects.values_list('id', 'name'):
+        exact[name].append((pk, name))
+        folded[normalize_text(name)].append((pk, name))
+
+    matched, ambiguous, unmatched = {}, {}, {}
+    for requested in names:
+        candidates = exact.get(requested) or folded.get(normalize_text(requested), [])
+        if len(candidates) == 1:
+            matched[requested] = candidates[0]
+        elif candidates:
+            ambiguous[requested] = candidates
         else:
-            star_objects.append(s_object)
-            print('Added {} to list of Stars'.format(star))
+            close = difflib.get_close_matches(normalize_text(requested), list(folded), n=3, cutoff=0.8)
+            unmatched[requested] = [folded[key][0][1] for key in close]
 
-    print('Gathered and returned {} Person objects.'.format(len(star_objects)))
-    print('Total errors: {}'.format(len(stars) - len(star_objects)))
+    return matched, ambiguous, unmatched
 
-    return star_objects
 
-def mark_starring_roles(actor):
+def starring_diff(person_ids, reset=False):
+    """What tag_starring_roles() would change: ({person_id: rows to mark}, {person_id: rows to unmark})"""
+    to_mark = dict(
+        Cast.objects.filter(person_id__in=person_ids, starring_role=False)
+        .values_list('person_id').annotate(n=Count('id'))
+    )
+    to_unmark = {}
+    if reset:
+        to_unmark = dict(
+            Cast.objects.filter(starring_role=True).exclude(person_id__in=person_ids)
+            .values_list('person_id').annotate(n=Count('id'))
+        )
+    return to_mark, to_unmark
 
-    actor_cast_records = Cast.objects.filter(person=actor)
 
-    for index, record in enumerate(actor_cast_records):
-        record.starring_role = True
-        record.save()
+def starring_credits(person_ids, reset=False):
+    """(movie_id, person_id) of every Cast row tag_starring_roles() would flip, for invalidating their pages"""
+    credits = Cast.objects.filter(person_id__in=person_ids, starring_role=False)
+    if reset:
+        credits |= Cast.objects.filter(starring_role=True).exclude(person_id__in=person_ids)
+    return list(credits.values_list('movie_id', 'person_id'))
 
-    print("All {} of {}'s roles have been marked as Starring Roles.".format(index, actor.name))
 
+def tag_starring_roles(person_ids, reset=False):
+    """Flip Cast.starring_role with one UPDATE (two with reset, which also clears everyone else's roles)"""
+    marked = Cast.objects.filter(person_id__in=person_ids, starring_role=False).update(starring_role=True)
+    unmarked = 0
+    if reset:
+        unmarked = Cast.objects.filter(starring_role=True).exclude(person_id__in=person_ids).update(starring_role=False)
+    return marked, unmarked
 
 
+def get_stars():
+    """Person objects for the STARS list (see manage.py tag_stars for the reporting version)"""
+    matched, ambiguous, unmatched = resolve_people(STARS)
 
+    for star in list(ambiguous) + list(unmatched):
+        print('Could not retrieve a Person object for {}'.format(star))
 
+    star_objects = Person.objects.filter(id__in=[pk for pk, name in matched.values()])
 
+    print('Gathered and returned {} Person objects.'.format(len(matched)))
+    print('Total errors: {}'.format(len(ambiguous) + len(unmatched)))
 
+    return star_objects
+
+def mark_starring_roles(actor):
 
+    count = Cast.objects.filter(person=actor, starring_role=False).update(starring_role=True)
 
+    print("{} more of {}'s roles have been marked as Starring Roles.".format(count, actor.name))
@@ -2,7 +2,7 @@
 
 from django.urls import path
 from .views import (IndexPage, MovieList, FreeMoviesList, MovieDetail, PersonList, PersonDetail, SearchResults, WriteReview,
-    DeleteReview, UserDetail, CreateUML, UpdateUML, GetRecommendations, FaqView, contactView, ContactSuccessView, autocomplete_view, mark_seen_view, mark_favorite_view, mark_watch_view)
+    DeleteReview, UserDetail, CreateUML, UpdateUML, GetRecommendations, FaqView, contactView, ContactSuccessView, autocomplete_view, mark_seen_view, mark_favorite_view, mark_watch_view, cache_stats_view)
 
 app_name = 'films'
 urlpatterns = [
@@ -57,6 +57,9 @@ urlpatterns = [
 
     path('auto_comp/', autocomplete_view, name='autocomplete'),
 
+    # staff only: page cache hit/miss counts for the worker that answers
+    path('cache_stats/', cache_stats_view, name='cache_stats'),
+
     ]
 
 
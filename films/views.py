@@ -1,107 +1,84 @@
-from itertools import chain
-from operator import attrgetter
-from random import sample, randint
+from collections import defaultdict
+from random import sample
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, redirect
 #from django.contrib.auth.decorators import login_required          # no longer used after switch to class-based views
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.http import HttpResponse, JsonResponse
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.functional import SimpleLazyObject
 from django.core.mail import send_mail, BadHeaderError
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 
 from django.contrib.auth import get_user_model # this is here so user_detail view can set its model to user Model
 
 from django.views.generic import (TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView)
-from .models import (Person, Movie, Cast, Job, Crew, Review, UserMovieLink, MediaLink, DailyMovie)
+from .models import (Person, Movie, Cast, Job, Crew, Review, UserMovieLink, MediaLink)
 from .forms import ReviewForm, ContactForm
+from .catalog import get_movie_index, free_movie_count
+from .daily import get_daily_pick
+from .ranking import top_movies
+from .cache import MOVIE, PERSON, MOVIE_REVIEWS, PAGE_TIMEOUT, cached, cache_stats, fragment_version
+from .conditional import movie_validators, person_validators, movie_list_validators, free_list_validators
+from .search import search, page_of_hits, encode_cursor, get_suggestions, suggestions_etag
 
 
 class IndexPage(TemplateView):
     template_name = 'films/index.html'
+    page_cache_timeout = None
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # the anonymous page cache (middleware.py) mustn't keep the page past the daily pick's rollover
+        if self.page_cache_timeout is not None:
+            response.page_cache_timeout = self.page_cache_timeout
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        top_five = get_top_five()
-
-        current_daily_record = DailyMovie.objects.get(active_movie=True)
-        current_daily_movie = current_daily_record.movie
-
-        if not current_daily_record.check_update_status():
-            daily_movie = current_daily_movie         # 24 has not elapsed, keep the same movie
-        else:
-            active = True
-
-            while active:
-                random_num = randint(0, 580)
-                new_choice = Movie.objects.all()[random_num]
-
-                if new_choice.name == None:     # just a security check to avoid infinitely running while loop
-                    daily_movie = current_daily_movie
-                    active = False
-                else:
-                    if new_choice.name == current_daily_movie.name:  # you MUST check on a field, not compare the objects themselves; they will be different!
-                        continue                                 # Model objects are not identical, even if its the same record!
-                    else:
-                        current_daily_record.active_movie = False
-                        current_daily_record.save()
-
-                        new_record = DailyMovie(movie=new_choice, active_movie=True, daily_count=current_daily_record.daily_count+1)
-                        new_record.save()
-
-                        daily_movie = new_choice
-                        active = False
+        top_five = top_movies(5)
 
+        # picked, and cached until tomorrow, by daily.py
+        daily_pick = get_daily_pick() or {}
+        if daily_pick:
+            self.page_cache_timeout = max(60, int((daily_pick['expires'] - timezone.now()).total_seconds()))
 
-        daily_director = daily_movie.all_crew.get(crew__job__job_title='Director')
-        daily_media_links = daily_movie.medialink_set.all()
-
-        related_movies = daily_movie.get_related_movies()
-
-        free_count = Movie.objects.filter(medialink__free=True).distinct().count() # movies can have more than one free link, distinct avoids counting duplicates
+        free_count = free_movie_count() # kept current as media links change, see catalog.py
 
         context['free_count'] = free_count
         context['page_name'] = 'Welcome'
-        context['daily_director'] = daily_director
-        context['daily_movie'] = daily_movie
-        context['daily_media_links'] = daily_media_links
-        context['related_movies'] = related_movies
+        context['daily_director'] = daily_pick.get('director')
+        context['daily_movie'] = daily_pick.get('movie')
+        context['daily_media_links'] = daily_pick.get('media_links')
+        context['related_movies'] = daily_pick.get('related_movies')
         context['top_five'] = top_five
 
         return context
 
 
-class MovieList(ListView):
-    #paginate_by = 30
-    queryset = Movie.objects.order_by('name')
+@method_decorator(movie_list_validators, name='dispatch')
+class MovieList(TemplateView):
     template_name = 'films/all_movies.html'
-    context_object_name = 'all_movies'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
-        alphabet = 'abcdefghijklmnopqrstuvwxyz'
-        num_starts = ['5', '7', '9']
-
-        # all_movies = context['all_movies']
-        sorted_movies = {}
-        numerics = []
-
-        # create a key-value pair for each letter of alphabet, value is query result of movies starting with that letter
-        for i in alphabet:
-            sorted_movies[i] = Movie.objects.filter(display_name__istartswith=i).order_by('display_name')
+        # one cached list of (heading, [(url, display_name)]) sections, built from a single query (see catalog.py)
+        movie_index = get_movie_index()
 
-        # get the movies that don't start with a letter
-        for i in num_starts:
-            results = Movie.objects.filter(display_name__istartswith=i).order_by('name')
-            numerics.extend(results)
-
-        context['sorted_movies'] = sorted_movies
-        context['numerics'] = numerics
+        context['movie_index'] = movie_index
+        context['movie_count'] = sum(len(movies) for heading, movies in movie_index)
         context['page_name'] = 'All Movies'
         return context
 
 
+@method_decorator(free_list_validators, name='dispatch')
 class FreeMoviesList(ListView):
     paginate_by = 20
     template_name = 'films/free_movies.html'
@@ -109,9 +86,9 @@ class FreeMoviesList(ListView):
     count = 0
 
     def get_queryset(self):
-        # get only the movies with a free link
-        free_movies = Movie.objects.filter(medialink__free=True).distinct() # if a movie has more than one free medialink, it would show up twice without discint() here
-        self.count = free_movies.count()
+        # get only the movies with a free link; has_free_link is maintained from MediaLink, so no join or distinct()
+        free_movies = Movie.objects.filter(has_free_link=True)
+        self.count = free_movie_count()
 
         return free_movies
 
@@ -124,58 +101,81 @@ class FreeMoviesList(ListView):
         return context
 
 
+@method_decorator(movie_validators, name='dispatch')
 class MovieDetail(DetailView):
     model = Movie
     template_name = 'films/movie.html'
     context_object_name = 'movie'
     query_pk_and_slug = True
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # grab the Person objects based on their Job Title, via Crew
-        director = self.object.all_crew.get(crew__job__job_title='Director')
-        camera = self.object.all_crew.get(crew__job__job_title='Cinematographer')
-
-        try:
-            composer = self.object.all_crew.get(crew__job__job_title='Composer')
-        except Person.DoesNotExist: # prefix: name the model that you are attempting to retreive
-            composer = ''
-
-        # filter returns a list, so these will always be lists...
-        producers = self.object.all_crew.filter(crew__job__job_title='Producer')
-        writers = self.object.all_crew.filter(crew__job__job_title='Writer')
-
-        crew_dict = {
-            'director': director,
-            'camera': camera,
-            'composer': composer,
-            'producers': producers,
-            'writers': writers,
+    def get_crew_dict(self):
+        """All of the movie's crew in one joined query, grouped by job title here rather than one query per job"""
+        people_by_job = defaultdict(list)
+        crew = Crew.objects.filter(movie=self.object).select_related('person', 'job').order_by('person__name')
+        for credit in crew:
+            people_by_job[credit.job.job_title].append(credit.person)
+
+        def first(job_title):
+            people = people_by_job.get(job_title)
+            return people[0] if people else ''
+
+        return {
+            'director': first('Director'),
+            'camera': first('Cinematographer'),
+            'composer': first('Composer'),
+            'producers': people_by_job['Producer'],
+            'writers': people_by_job['Writer'],
         }
 
-        # the context does not actually include 'cast' objects; so to sort on 'starring role', you need to do
-        # it here, in the view.
+    def get_cast_pairs(self):
+        """[person, role] pairs for the starring cast and everybody else, from a single Cast query"""
+        starring_role_pairs = []
+        cast_role_pairs = []
 
-        # get all Person objects from this Movie's cast who are Starring Roles
-        starring_cast = self.object.all_cast.filter(cast__starring_role=True).order_by('name')
-        # get all Person objects from this Movie's cast who are not Starring Roles
-        cast = self.object.all_cast.filter(cast__starring_role=False).order_by('name')
-
-        starring_role_pairs = [] # store a Person object and role they played together in a list, nested in this list
-        cast_role_pairs = [] 
-
-        # get the role each person played from the intermediary table Cast, then store both (person and role) together in a list
-        for person in starring_cast:
-            role_played = person.cast_set.get(movie=self.object).role  # role is an attribute of the cast object returned by the query
-            starring_role_pairs.append([person, role_played])
+        # the role and starring_role flag live on Cast itself, so there's no need for a cast_set.get() per person
+        credits = Cast.objects.filter(movie=self.object).select_related('person').order_by('person__name')
+        for credit in credits:
+            if credit.starring_role:
+                starring_role_pairs.append([credit.person, credit.role])
+            else:
+                cast_role_pairs.append([credit.person, credit.role])
+
+        return starring_role_pairs, cast_role_pairs
+
+    def get_credits(self):
+        """Crew, cast and media links: the same for every visitor, and only changed by credit or link edits"""
+        starring_role_pairs, cast_role_pairs = self.get_cast_pairs()
+        return {
+            'crew_dict': self.get_crew_dict(),
+            'starring_list': starring_role_pairs,
+            'cast_list': cast_role_pairs,
+            # this is a reverse connection (MediaLink defines the FK relationship to Movie)
+            'media_links': list(self.object.medialink_set.all()),
+        }
 
-        # get the role each person played from the intermediary table Cast, then store both (person and role) together in a list
-        for person in cast:
-            role_played = person.cast_set.get(movie=self.object).role # grab role attribute from record instance returned by get()
-            #role_played = self.object.cast_set.get(person=person).role
-            cast_role_pairs.append([person, role_played])
+    def get_reviews(self):
+        # reviews with just enough of their users for the 'by username' line in the template
+        reviews = self.object.review_set.select_related('user').only(
+            'id', 'movie_id', 'star_rating', 'review_text', 'date_added', 'user__id', 'user__username')
+        return list(reviews.order_by('-date_added'))
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        movie_id = self.object.id
+
+        # the shared parts of movie.html are cached as template fragments keyed on these versions (see cache.py),
+        # so the data behind them is left lazy: it's only fetched (or read from the page cache) when a fragment
+        # actually has to be rendered
+        context['credits_version'] = fragment_version((MOVIE, movie_id))
+        context['reviews_version'] = fragment_version((MOVIE_REVIEWS, movie_id))
+        context['fragment_timeout'] = PAGE_TIMEOUT
+
+        credits = SimpleLazyObject(lambda: cached('movie_credits:{}'.format(movie_id), [(MOVIE, movie_id)],
+                                                  self.get_credits))
+        for name in ['crew_dict', 'starring_list', 'cast_list', 'media_links']:
+            context[name] = SimpleLazyObject(lambda name=name: credits[name])
+        context['reviews'] = SimpleLazyObject(lambda: cached('movie_reviews:{}'.format(movie_id),
+                                                             [(MOVIE_REVIEWS, movie_id)], self.get_reviews))
 
         # the movie.based_on field is a CharField, but I want to break it down into smaller pieces, for better template formatting:
         if self.object.based_on != 'n/a':
@@ -186,30 +186,13 @@ class MovieDetail(DetailView):
             context['based_on_list'] = based_on_list  # note: if movie.based_on == 'n/a', the template context will not have this element;
                                                       # right now that's ok, because the template does a check on movie.based_on, not on the context...
 
-        # get any reviews of the movie. the template will do the conditional check against None.
-        movie_reviews = self.object.review_set.all().order_by('-date_added')
-
-        # get any medialink records from MediaLink table; this is also a reverse connection
-        # (MediaLink defines the FK relationship to Movie)
-        media_links = self.object.medialink_set.all()
-
         if self.request.user.is_authenticated:
 
-            # get user's movie review, if one exists:
-            if Review.objects.filter(movie=self.object, user=self.request.user).exists():
-                user_review = Review.objects.get(movie=self.object, user=self.request.user)
-
-            else:
-                user_review = None
+            # one indexed lookup (user and movie are unique together), rather than loading the cached review list
+            user_review = Review.objects.filter(movie=self.object, user=self.request.user).first()
 
             # get UserMovieLink (details of user+movie), if one exists:
-            if UserMovieLink.objects.filter(movie=self.object, user=self.request.user).exists():
-                user_movie_details = UserMovieLink.objects.get(movie=self.object, user=self.request.user)
-            else:
-                user_movie_details = None
-
-            # important note: you MUST use filter, not get, when doing an 'exists' check.
-            # if you use get, it will still raise a DoesNotExist error.
+            user_movie_details = UserMovieLink.objects.filter(movie=self.object, user=self.request.user).first()
 
         # user not logged in, give user review and user movie details both values of None
         else:
@@ -230,11 +213,6 @@ class MovieDetail(DetailView):
 
 
         # build the complete context
-        context['crew_dict'] = crew_dict
-        context['starring_list'] = starring_role_pairs
-        context['cast_list'] = cast_role_pairs
-        context['reviews'] = movie_reviews
-        context['media_links'] = media_links
         context['user_review'] = user_review       # value is Review object or None
         context['user_movie_details'] = user_movie_details  # value is UserMovieLink object or None
         context['actions'] = action_dict
@@ -250,43 +228,38 @@ class PersonList(ListView):
     context_object_name = 'all_people'
 
 
+@method_decorator(person_validators, name='dispatch')
 class PersonDetail(DetailView):
     model = Person
     template_name = 'films/person.html'
     context_object_name = 'person'
     query_pk_and_slug = True
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-
-        # my additional context...
+    # title first (it carries the year), then year and id so remakes and same-named films keep a fixed order
+    filmography_order = ['movie__name', 'movie__year', 'movie__id']
 
-        # get all Movie objects from Person object, via related name moves_cast
-        movies_as_actor = self.object.movies_cast.distinct().order_by('name')
-        movie_role_pairs = []
+    def get_filmography(self):
+        """[movie, role] and [movie, [jobs]] pairs, from one Cast and one Crew query with the movies joined in"""
+        roles = {}
+        for credit in Cast.objects.filter(person=self.object).select_related('movie').order_by(*self.filmography_order):
+            # the odd actor has two parts in the same film; list them together rather than the film twice
+            roles.setdefault(credit.movie_id, [credit.movie, []])[1].append(credit.role)
+        movie_role_pairs = [[movie, ' / '.join(role for role in parts if role)] for movie, parts in roles.values()]
 
-        if movies_as_actor:
-            for movie in movies_as_actor:
-                role_played = self.object.cast_set.get(movie=movie).role # alternately, we could go through movie
-                movie_role_pairs.append([movie, role_played])
+        jobs = {}
+        crew = Crew.objects.filter(person=self.object).select_related('movie', 'job')
+        for credit in crew.order_by(*self.filmography_order, 'job_id'):
+            jobs.setdefault(credit.movie_id, [credit.movie, []])[1].append(credit.job)
+        movie_job_pairs = list(jobs.values())
 
-        # get all Movie objects from Person object, via related name movies_crew
+        return movie_role_pairs, movie_job_pairs
 
-        # use .distinct() to avoid getting duplicate movie objects (some people have multiple crew credits on one movie)
-        movies_as_crew = self.object.movies_crew.distinct().order_by('name') # why is this not working? template results are not alphabetical!
-        movie_job_pairs = []
-
-        if movies_as_crew:
-            for movie in movies_as_crew:
-                job_list = []
-                # get crew objects, through Person object, via reverse manager crew_set, for current movie
-                crew_credits = self.object.crew_set.filter(movie=movie)
-
-                # we can use direct access from crew object to get the job object with .job
-                for crew_ob in crew_credits:
-                    job_list.append(crew_ob.job) # add job object to job_list
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
 
-                movie_job_pairs.append([movie, job_list])
+        # cached until the person or one of their credits (or a film's title) changes, see cache.py
+        movie_role_pairs, movie_job_pairs = cached(
+            'person_detail:{}'.format(self.object.id), [(PERSON, self.object.id)], self.get_filmography)
 
         context['movie_role_pairs'] = movie_role_pairs
         context['movie_job_pairs'] = movie_job_pairs
@@ -294,30 +267,37 @@ class PersonDetail(DetailView):
         return context
 
 
-class SearchResults(ListView):
+class SearchResults(TemplateView):
     paginate_by = 20
     template_name = 'films/search_results.html'
-    context_object_name = 'search_results'
-    count = 0
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['count'] = self.count or 0
-        context['query'] = self.request.GET.get('q') # this is here purely so we can display it in the template
+        query = self.request.GET.get('q')
+        context['query'] = query # this is here purely so we can display it in the template
 
-        movie_results = []
-        people_results = []
+        # movies and people come back from the search index already merged and ranked (search.py); the page is
+        # cut from that list by cursor, and only its twenty rows are fetched from the db
+        hits = search(query)
+        start, page = page_of_hits(hits, self.paginate_by,
+                                   after=self.request.GET.get('after'), before=self.request.GET.get('before'))
 
-        # Note: yes, you can access 'search_results' from the context object here, after the call to
-        # super-- this works because get_queryset has already been called, and the result returned from it has been
-        # given the name 'search_results' as defined in the attributes above these methods (context_object_name = ...)
-        search_results = context['search_results']
+        movies = Movie.objects.in_bulk([hit.entry.pk for hit in page if hit.entry.kind == MOVIE])
+        people = Person.objects.in_bulk([hit.entry.pk for hit in page if hit.entry.kind == PERSON])
 
-        for result in search_results:
-            if isinstance(result, Movie):
-                movie_results.append(result)
-            else:
-                people_results.append(result)
+        movie_results = []
+        people_results = []
+        for hit in page:
+            if hit.entry.kind == MOVIE and hit.entry.pk in movies:  # (missing if deleted since the index heard)
+                movie_results.append(movies[hit.entry.pk])
+            elif hit.entry.kind == PERSON and hit.entry.pk in people:
+                people_results.append(people[hit.entry.pk])
+
+        context['count'] = len(hits)
+        context['first_shown'] = start + 1 if page else 0
+        context['last_shown'] = start + len(page)
+        context['previous_cursor'] = encode_cursor(page[0]) if page and start > 0 else None
+        context['next_cursor'] = encode_cursor(page[-1]) if page and start + len(page) < len(hits) else None
 
         context['movie_results'] = movie_results
         context['people_results'] = people_results
@@ -325,48 +305,25 @@ class SearchResults(ListView):
 
         return context
 
-    def get_queryset(self):
-
-        query = self.request.GET.get('q') # self is the instance of the class-based view, create per-use.
-
-        movie_list = Movie.objects.filter(name__icontains=query).order_by('name')
-        person_list = Person.objects.filter(name__icontains=query).order_by('name')
-
-        total_list = sorted(chain(movie_list, person_list), key=attrgetter('name'))
-
-        # Q: isn't it redundant to use both order_by() on the query and sorted() on the total list?
-
-        self.count = len(total_list) # update the count so it can be displayed in results
-
-        return total_list
-
 
+@cache_control(public=True, max_age=getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 300))
+@condition(etag_func=lambda request: suggestions_etag(request.GET.get('term')))
 def autocomplete_view(request):
     """Called by the jQueryUI autocomplete widget to use ajax for autocompletion in search field"""
-    if 'term' in request.GET:
-        qs_movies = Movie.objects.filter(display_name__icontains=request.GET.get('term'))
-        qs_people = Person.objects.filter(name__icontains=request.GET.get('term'))
-
-        total_package = []
-
-        for movie in qs_movies:
-            name = movie.display_name
-            relative_url = movie.get_absolute_url()
-            url = request.build_absolute_uri(relative_url)
-            total_package.append({'label': name, 'url': url})
-
-        for person in qs_people:
-            name = person.name
-            relative_url = person.get_absolute_url()
-            url = request.build_absolute_uri(relative_url)
-            total_package.append({'label': name, 'url': url})
-
-        return JsonResponse(total_package, safe=False)
+    # the first AUTOCOMPLETE_LIMIT suggestions, each with its relative url, straight from the search index; the
+    # ETag lets the browser keep reusing them until a Movie or Person changes (see search.py)
+    return JsonResponse(get_suggestions(request.GET.get('term')), safe=False)
 
     # note that this function is not a typical view -- it does not render a new page; it exists only to 
     # return JSON data to the caller (jQuery UI autocomplete). 
 
 
+@staff_member_required
+def cache_stats_view(request):
+    """Page cache hits and misses (see cache.py); the counts are for whichever worker process answers"""
+    return JsonResponse(cache_stats())
+
+
 class UserDetail(LoginRequiredMixin, DetailView): # I'm assuming this mixin works on DetailView as well as CreateView...
     model = get_user_model()
     template_name = 'films/user_detail.html'
@@ -685,20 +642,3 @@ def contactView(request):
 
 class ContactSuccessView(TemplateView):
     template_name = 'films/contact_success.html'
-
-def get_top_five():
-    """Query the db for the top five of highest rated + most reviewed Movies"""
-
-    # this is simply a placeholder until I create the logic to query top movies based on num reviews and star ratings...
-    t1 = Movie.objects.get(name__icontains='out of the past')
-    t2 = Movie.objects.get(name__icontains='double indem')
-    t3 = Movie.objects.get(name__icontains='big sleep')
-    t4 = Movie.objects.get(name__icontains='scarlet street')
-    t5 = Movie.objects.get(name__icontains='maltese falcon')
-
-    top_five = [t1, t2, t3, t4, t5]
-
-    return top_five
-
-
-
@@ -59,6 +59,7 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'films.middleware.AnonymousPageCacheMiddleware',    # before sessions, so cached pages skip them entirely
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -102,6 +103,20 @@ DATABASES = {
     }
 }
 
+# Cache
+# the shared tier behind films/cache.py; locmem is the local stand-in (one copy per process, nothing to install)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'noirdb',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    }
+}
+
+LOCAL_CACHE_SIZE = 500      # entries kept in each process's LRU in front of CACHES
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -163,3 +178,10 @@ LOGOUT_REDIRECT_URL = 'films:index'        # using this overrides the django def
 DEFAULT_FROM_EMAIL = 'mholloway@audiophonic.com'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+
+# search box suggestions (films/search.py)
+AUTOCOMPLETE_LIMIT = 10        # most suggestions sent back for one term
+AUTOCOMPLETE_MAX_AGE = 300     # seconds a browser may reuse the suggestions for a term
+
+# static copies of the catalog pages for the web server (manage.py prerender, films/prerender.py)
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
@@ -52,6 +52,7 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'films.middleware.AnonymousPageCacheMiddleware',    # before sessions, so cached pages skip them entirely
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -97,6 +98,29 @@ DATABASES = {
     }
 }
 
+# Cache
+# the shared tier behind films/cache.py: memcached if MEMCACHED_LOCATION is set (e.g. '127.0.0.1:11211'),
+# otherwise files on disk, which every worker process can share
+
+if os.getenv("MEMCACHED_LOCATION"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.getenv("MEMCACHED_LOCATION"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv("CACHE_DIR", os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 20000},
+        }
+    }
+
+LOCAL_CACHE_SIZE = 500      # entries kept in each process's LRU in front of CACHES
+
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -166,3 +190,10 @@ EMAL_USE_TLS = True
 
 
 
+
+# search box suggestions (films/search.py)
+AUTOCOMPLETE_LIMIT = 10        # most suggestions sent back for one term
+AUTOCOMPLETE_MAX_AGE = 300     # seconds a browser may reuse the suggestions for a term
+
+# static copies of the catalog pages for the web server (manage.py prerender, films/prerender.py)
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
@@ -17,6 +17,19 @@ from django.conf import settings            # needed to have local access to sta
 from django.conf.urls.static import static # same
 from django.contrib import admin
 from django.urls import path, include
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+from films.storage import is_hashed_name
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """Like serve(), but content-addressed poster files (films/storage.py) can be cached forever"""
+    response = serve(request, path, document_root=document_root, show_indexes=show_indexes)
+    if response.status_code == 200 and is_hashed_name(path):
+        patch_cache_control(response, max_age=31536000, public=True, immutable=True)
+    return response
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,7 +40,10 @@ urlpatterns = [
 # for developement; so I have access to local images and css, etc.
 if settings.DEBUG: 
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # poster files are named by content hash (films/storage.py), so their URLs never change meaning and can be
+    # cached forever; anything else under media (older posters, other uploads) gets the default headers. In
+    # production the web server should send the same header for /media/posters/xx/<64 hex digits>.*
+    urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
 
 
 